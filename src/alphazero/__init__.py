@@ -1,6 +1,11 @@
 from .quoridor_representation import QuoridorRepresentation
 from .quoridor_model import QuoridorModel, ModelConfig
+from .mcts_tree import MCTSTree
+from .evaluation_cache import EvaluationCache
 from .mcts import MCTS
+from .root_parallel_mcts import RootParallelMCTS
+from .time_manager import TimeManager
+from .inference_server import InferenceServer, InferenceClient
 from .self_player import SelfPlayer, SelfPlayConfig
 from .trainer import Trainer, TrainingConfig
 from .manager import Manager
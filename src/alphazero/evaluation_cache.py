@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import threading
+import numpy as np
+
+# Rough per-entry overhead (key tuple, dict slot and array headers) added to the size of the priors
+ENTRY_OVERHEAD = 256
+
+
+class EvaluationCache:
+    """LRU cache of the model evaluations (priors and value) of the searched states
+
+    Entries are keyed by the Zobrist key of the state along with a hash of its state planes
+    (the model input also depends on the previous states). The number of entries is bounded
+    so that the cache stays under the provided memory cap. Accesses are locked so that the
+    cache can be shared by the threads of a tree-parallel search.
+    """
+
+    def __init__(self, nb_actions: int, max_memory_mb: float = 256) -> None:
+        self.nb_actions = nb_actions
+        self.max_memory_mb = max_memory_mb
+        entry_size = nb_actions * np.dtype(np.float32).itemsize + ENTRY_OVERHEAD
+        self.max_entries = int(max_memory_mb * 2**20) // entry_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(state_key: int, state_planes) -> tuple:
+        return state_key, hash(state_planes.numpy().tobytes())
+
+    def get(self, key: tuple):
+        """Returns the cached (priors, value) of a key (None if missing)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, priors: np.ndarray, value: float) -> None:
+        if self.max_entries <= 0:
+            return
+        # NOTE: copy the priors so that they do not keep the whole evaluated batch alive
+        entry = (np.array(priors, dtype=np.float32), value)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            # Evict the least recently used entries
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def hit_rate(self) -> float:
+        nb_queries = self.hits + self.misses
+        return self.hits / nb_queries if nb_queries > 0 else 0.0
+
+    def description(self) -> str:
+        return f"EvaluationCache: entries={len(self.entries)}/{self.max_entries} ({self.max_memory_mb}MB); hits={self.hits}; misses={self.misses}; hit rate={self.hit_rate():.3f}"
@@ -0,0 +1,178 @@
+import queue
+import time
+import torch
+
+from environment import QuoridorConfig
+from alphazero import QuoridorRepresentation, QuoridorModel
+
+
+class InferenceClient:
+    """Stand-in for the model in the self-play workers, forwarding the evaluations to an InferenceServer
+
+    The state planes of a request are written in a shared-memory buffer owned by the client,
+    the request is announced on the queue of the server and the priors and values are read back
+    from the client buffers once the server has answered.
+    """
+
+    def __init__(self, client_idx: int, planes: torch.Tensor,
+                 priors: torch.Tensor, values: torch.Tensor, request_queue,
+                 response_queue) -> None:
+        self.client_idx = client_idx
+        # The buffers are filled from the CPU (see MCTS.evaluate)
+        self.device = torch.device("cpu")
+        self.planes = planes
+        self.priors = priors
+        self.values = values
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+
+    def __call__(self, batch_planes: torch.Tensor):
+        # Larger batches than the client buffers are split in several requests
+        capacity = len(self.planes)
+        batch_priors = []
+        batch_values = []
+        for start in range(0, len(batch_planes), capacity):
+            nb_states = min(capacity, len(batch_planes) - start)
+            self.planes[:nb_states] = batch_planes[start:start + nb_states]
+            self.request_queue.put((self.client_idx, nb_states))
+            self.response_queue.get()
+            batch_priors.append(self.priors[:nb_states].clone())
+            batch_values.append(self.values[:nb_states].clone())
+        return torch.cat(batch_priors), torch.cat(batch_values)
+
+
+class InferenceServer:
+    """Process owning the model and evaluating the requests of several InferenceClient by batches
+
+    A batch is formed from the first pending request and the requests received until either
+    max_batch_size states are gathered or max_wait_us microseconds have elapsed.
+    """
+
+    def __init__(self,
+                 model: QuoridorModel,
+                 game_config: QuoridorConfig,
+                 representation: QuoridorRepresentation,
+                 nb_clients: int,
+                 client_capacity: int,
+                 max_batch_size: int = 64,
+                 max_wait_us: int = 500) -> None:
+        self.model = model
+        self.nb_clients = nb_clients
+        self.client_capacity = client_capacity
+        self.max_batch_size = max_batch_size
+        self.max_wait_us = max_wait_us
+
+        # Shared-memory buffers of each client
+        input_shape = (representation.nb_channels, game_config.grid_size,
+                       game_config.grid_size)
+        self.planes = torch.zeros(
+            (nb_clients, client_capacity) + input_shape).share_memory_()
+        self.priors = torch.zeros((nb_clients, client_capacity,
+                                   game_config.nb_actions)).share_memory_()
+        self.values = torch.zeros(
+            (nb_clients, client_capacity, 1)).share_memory_()
+
+        self.process = None
+        self.request_queue = None
+        self.response_queues = None
+
+    def start(self, context):
+        """Starts the server process
+
+        Args:
+            context: the multiprocessing context used to create the process and the queues
+        """
+        self.model.share_memory()
+        self.request_queue = context.Queue()
+        self.response_queues = [
+            context.SimpleQueue() for _ in range(self.nb_clients)
+        ]
+        self.process = context.Process(
+            target=serve_inference,
+            args=(self.model, self.planes, self.priors, self.values,
+                  self.request_queue, self.response_queues,
+                  self.max_batch_size, self.max_wait_us))
+        self.process.start()
+
+    def get_client(self, client_idx: int) -> InferenceClient:
+        return InferenceClient(client_idx, self.planes[client_idx],
+                               self.priors[client_idx],
+                               self.values[client_idx], self.request_queue,
+                               self.response_queues[client_idx])
+
+    def stop(self):
+        # The server stops once it reads None
+        self.request_queue.put(None)
+        self.process.join()
+
+    def description(self) -> str:
+        return f"InferenceServer: clients={self.nb_clients}; client capacity={self.client_capacity}; max_batch_size={self.max_batch_size}; max_wait_us={self.max_wait_us}"
+
+
+def serve_inference(model: QuoridorModel, planes: torch.Tensor,
+                    priors: torch.Tensor, values: torch.Tensor, request_queue,
+                    response_queues, max_batch_size: int, max_wait_us: int):
+    """Loop of the inference server process (see InferenceServer)
+
+    Args:
+        model (QuoridorModel): the model (whose weights are in shared memory)
+        planes (torch.Tensor): the input buffers of the clients
+        priors (torch.Tensor): the priors buffers of the clients
+        values (torch.Tensor): the values buffers of the clients
+        request_queue: the queue of the (client index, number of states) requests (None to stop)
+        response_queues: the queues notifying each client that its request was evaluated
+        max_batch_size (int): the number of states after which a batch is evaluated without waiting
+        max_wait_us (int): the maximum waiting time (in microseconds) for more requests
+    """
+    model.eval()
+    nb_batches = 0
+    nb_evaluated_states = 0
+    stopping = False
+    while not stopping:
+        request = request_queue.get()
+        if request is None:
+            break
+        requests = [request]
+        nb_states = request[1]
+
+        # Gather more requests until the batch is full or the waiting time has elapsed
+        deadline = time.perf_counter() + max_wait_us * 1e-6
+        while nb_states < max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = request_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                stopping = True
+                break
+            requests.append(request)
+            nb_states += request[1]
+
+        batch_planes = torch.cat([
+            planes[client_idx, :nb_client_states]
+            for client_idx, nb_client_states in requests
+        ])
+        with torch.no_grad():
+            p, v = model(batch_planes.to(model.device))
+        p = p.cpu()
+        v = v.cpu()
+
+        # Dispatch the results to the clients
+        offset = 0
+        for client_idx, nb_client_states in requests:
+            priors[client_idx, :nb_client_states] = p[offset:offset +
+                                                      nb_client_states]
+            values[client_idx, :nb_client_states] = v[offset:offset +
+                                                      nb_client_states]
+            offset += nb_client_states
+            response_queues[client_idx].put(None)
+
+        nb_batches += 1
+        nb_evaluated_states += nb_states
+
+    print(
+        f"InferenceServer: evaluated {nb_evaluated_states} states in {nb_batches} batches"
+    )
@@ -1,32 +1,16 @@
 import torch
-from collections import defaultdict
 from math import sqrt
-from copy import deepcopy, copy
 import numpy as np
 import time
 import os
+import threading
 
-from alphazero import QuoridorRepresentation, QuoridorModel
+from alphazero import QuoridorRepresentation, QuoridorModel, MCTSTree, EvaluationCache
+from alphazero.quoridor_representation import FeatureHistory
 from environment import QuoridorState, QuoridorEnv, QuoridorConfig
 from utils import change_action_perspective, write_history
 
 
-class ActionRecord:
-    def __init__(self) -> None:
-        self.N_sa = 0
-        self.W_sa = 0
-        self.Q_sa = 0
-        self.P_sa = 0
-
-
-class StateRecord:
-    def __init__(self) -> None:
-        self.actions = defaultdict(ActionRecord)
-        # The sum over all actions expanded in this node record
-        self.N_s = 0
-        self.pi_s = None
-
-
 class MCTS:
     def __init__(self,
                  game_config: QuoridorConfig,
@@ -34,21 +18,55 @@ class MCTS:
                  state_representation: QuoridorRepresentation,
                  c_puct: float = 1.25,
                  epsilon: float = 0.25,
-                 dir_alpha=0.1) -> None:
+                 dir_alpha=0.1,
+                 dir_alpha_scale: float = 10.0,
+                 nb_parallel_leaves: int = 1,
+                 virtual_loss: int = 1,
+                 reuse_tree: bool = True,
+                 evaluation_cache: EvaluationCache = None,
+                 early_stopping: bool = False,
+                 nb_threads: int = 1,
+                 max_tree_nodes: int = None,
+                 max_tree_mb: float = None) -> None:
         self.nb_actions = game_config.nb_actions
 
+        # Number of leaves evaluated at once by the model (see search_batch) and the virtual loss used to collect them
+        self.nb_parallel_leaves = nb_parallel_leaves
+        self.virtual_loss = virtual_loss
+        # Whether to keep the subtree of the searched state from one move to the next
+        self.reuse_tree = reuse_tree
+        # Optional cache of the model evaluations (possibly shared with other searches)
+        self.evaluation_cache = evaluation_cache
+        # Whether to stop deterministic searches once the most visited root action is decided (see is_decided)
+        self.early_stopping = early_stopping
+        # Number of threads searching the tree concurrently (see search_threads)
+        self.nb_threads = nb_threads
+
         self.c_puct = c_puct
         self.epsilon = epsilon
         self.dir_alpha = dir_alpha
-
-        self.tree = defaultdict(StateRecord)
+        # If provided, the Dirichlet concentration is dir_alpha_scale divided by the number of legal actions (instead of dir_alpha)
+        self.dir_alpha_scale = dir_alpha_scale
+        # Key of the root state whose priors are mixed with noise (None if disabled) and its noisy priors (see set_root)
+        self.noisy_root_key = None
+        self.noisy_root_priors = None
+
+        # perspective_indices[action_idx] is the index of the action from the perspective of player 1
+        self.perspective_indices = np.array([
+            change_action_perspective(1, action_idx, game_config.grid_size)
+            for action_idx in range(self.nb_actions)
+        ])
+
+        # The tree is shrunk between searches once it exceeds its budget (see MCTSTree.enforce_budget)
+        self.tree = MCTSTree(max_nodes=max_tree_nodes,
+                             max_memory_mb=max_tree_mb)
         # The current model used for evaluation
         self.model = model
         self.state_representation = state_representation
 
     def reset_tree(self):
         # Reset the search tree
-        self.tree = defaultdict(StateRecord)
+        self.tree.reset()
 
     def select_action(self,
                       environment: QuoridorEnv,
@@ -57,11 +75,10 @@ class MCTS:
                       nb_simulations: int = 800,
                       temperature: float = 1,
                       limited_time: float = None,
-                      intermediate_reward=False):
-        # Selects an action provided the current state
-
-        # Don't forget to reset the tree
-        self.reset_tree()
+                      intermediate_reward=False,
+                      root_noise=False):
+        # Selects an action provided the current state (with Dirichlet noise mixed into the root priors if root_noise)
+        self.set_root(state, root_noise)
 
         # Compute the policy with MCTS
         policy = self.play_policy(environment,
@@ -72,72 +89,92 @@ class MCTS:
                                   limited_time=limited_time,
                                   intermediate_reward=intermediate_reward)
 
+        return self.sample_action(environment, state, policy), policy
+
+    def set_root(self, state: QuoridorState, root_noise=False):
+        # Keep the subtree of the current state (i.e. the visits computed during the previous moves) or reset the tree
+        if self.reuse_tree:
+            self.tree.prune(state.key)
+            self.tree.enforce_budget(state.key)
+        else:
+            self.reset_tree()
+        # The noise is sampled once for the whole search, at the first selection from the root (see select_edge)
+        self.noisy_root_key = state.key if root_noise else None
+        self.noisy_root_priors = None
+
+    def sample_action(self, environment: QuoridorEnv, state: QuoridorState,
+                      policy: np.ndarray) -> int:
         # Return the action according to the provided policy distribution
         return change_action_perspective(
             state.current_player,
             int(np.random.choice(np.arange(self.nb_actions), p=policy)),
-            grid_size=environment.grid_size), policy
+            grid_size=environment.grid_size)
 
     def puct_action(self,
                     environment: QuoridorEnv,
                     state: QuoridorState,
-                    state_str: str,
-                    is_root_state=False):
-        state_record = self.tree[state_str]
+                    state_key: int):
+        edge_idx = self.select_edge(environment, state,
+                                    self.tree.get_node(state_key))
+        if edge_idx == -1:
+            return -1
+        return int(self.tree.edge_actions[edge_idx])
+
+    def select_edge(self,
+                    environment: QuoridorEnv,
+                    state: QuoridorState,
+                    node_idx: int) -> int:
+        # Returns the index (in the tree edge arrays) of the edge maximizing the PUCT score
+        tree = self.tree
 
         # Update action probabilities by renormalizing over valid actions
-        # Just after expansion, get all possible actions
-        if state_record.pi_s is not None:
-            sum_p = 0
-            # print(state.to_string(add_nb_walls=True, add_current_player=True))
-            # print([
-            #     action.to_string()
-            #     for action in environment.get_possible_actions(state)
-            # ])
-            for action in environment.get_possible_actions(state):
-                action_idx = action.to_perspective(
-                    state.current_player,
-                    environment.grid_size).to_index(environment.grid_size)
-                # Action probabilities have already been stored in the StateRecord normally
-                action_p = state_record.pi_s[action_idx]
-                # Thus, update the ActionRecords accordingly
-                state_record.actions[action_idx].P_sa = action_p
-                sum_p += action_p
+        # Just after expansion, get the mask of all possible actions
+        if not tree.has_edges(node_idx):
+            legal_mask = environment.legal_action_mask(state)
+            # Express the mask from the current player perspective (perspective changes are involutions)
+            if state.current_player == 1:
+                legal_mask = legal_mask[self.perspective_indices]
+            action_indices = np.flatnonzero(legal_mask)
+            # The actions as pushed on the state are cached along with them
+            move_indices = self.perspective_indices[
+                action_indices] if state.current_player == 1 else action_indices
+            priors = tree.node_priors[node_idx][action_indices]
             # Normalize probabilities over valid actions only
-            for action in state_record.actions.values():
-                # Add a small constant to ensure that we do not divide by zero
-                action.P_sa /= (sum_p + 1e-8)
-            # Clear the temporary pi from the StateRecord
-            state_record.pi_s = None
-
-        best_val = -float('inf')
-        best_action_idx = -1
-        for action_idx, action_record in state_record.actions.items():
-            P_sa = action_record.P_sa
-            # If we're in the root state, apply dirichlet noise
-            if is_root_state:
-                # TODO: check random alpha here
-                P_sa = (1.0 - self.epsilon
-                        ) * P_sa + self.epsilon * np.random.dirichlet(
-                            self.dir_alpha)
-            val = action_record.Q_sa + self.c_puct * P_sa * sqrt(
-                state_record.N_s) / (1 + action_record.N_sa)
-            if val > best_val:
-                best_val = val
-                best_action_idx = action_idx
-        if best_action_idx == -1:
+            # Add a small constant to ensure that we do not divide by zero
+            priors /= np.sum(priors) + 1e-8
+            tree.add_edges(node_idx, action_indices, move_indices, priors)
+
+        edges = tree.get_edges(node_idx)
+        if edges.start == edges.stop:
             print("No best action")
-        return best_action_idx
+            return -1
+
+        P_sa = tree.edge_P[edges]
+        # If we're in the root state, apply dirichlet noise
+        if state.key == self.noisy_root_key:
+            if self.noisy_root_priors is None:
+                dir_alpha = self.dir_alpha
+                if self.dir_alpha_scale is not None:
+                    dir_alpha = self.dir_alpha_scale / len(P_sa)
+                self.noisy_root_priors = (
+                    1.0 - self.epsilon) * P_sa + self.epsilon * np.random.dirichlet(
+                        np.full(len(P_sa), dir_alpha))
+            P_sa = self.noisy_root_priors
+        # PUCT scores of all the edges at once
+        val = tree.edge_Q[edges] + (self.c_puct * sqrt(
+            tree.node_N[node_idx])) * P_sa / (1 + tree.edge_N[edges])
+        return edges.start + int(np.argmax(val))
 
 
 # NOTE: make sure the searched state is in canonical form
 
-# Feature_planes provide the already computed feature_planes
+# The history provides the instant planes of the previous states (see FeatureHistory)
 
     def search_intermediate(self, environment: QuoridorEnv,
-                            state: QuoridorState, init_feature_planes):
+                            state: QuoridorState, history: FeatureHistory):
 
-        feature_planes = deepcopy(init_feature_planes)
+        # The planes pushed during the search are dropped once it is over
+        history_length = len(history)
         explored_branches = []
         branch_value = 0.0
         # history = []
@@ -158,39 +195,39 @@ class MCTS:
                 # exit()
                 break
 
-            state_str = state.to_string(add_nb_walls=True,
-                                        add_current_player=True)
+            # The tree is keyed by the Zobrist key of the states
+            state_key = state.key
             # history.append(
             #     state.to_string(add_nb_walls=True, add_current_player=True))
             # last_state_t = state.t
-            #print(f"Searching {state_str} with depth {len(feature_planes)}")
-            current_feature_plane = self.state_representation.generate_instant_planes(
-                state)
-            feature_planes.append(current_feature_plane)
+            #print(f"Searching {state_key} with depth {len(history)}")
+            history.push(state)
 
             # If the searched state is not in the tree, EXPAND
-            if state_str not in self.tree:
-                state_planes = self.state_representation.generate_state_planes(
-                    state, feature_planes)
-                p, v = self.model(
-                    state_planes.unsqueeze(0).to(self.model.device))
-                p = p[0]
-                self.tree[state_str].pi_s = p
-                branch_value = v
+            node_idx = self.tree.get_node(state_key)
+            if node_idx == -1:
+                state_planes = history.state_planes(state)
+                p, v = self.evaluate([state_key], [state_planes])
+                node_idx = self.tree.add_node(state_key, p[0])
+                if len(explored_branches) > 0:
+                    self.tree.set_child(explored_branches[-1][1], node_idx)
+                branch_value = float(v[0])
                 break
+            if len(explored_branches) > 0:
+                self.tree.set_child(explored_branches[-1][1], node_idx)
 
             # Otherwise, select and iterate
-            action_idx = self.puct_action(environment, state, state_str)
+            edge_idx = self.select_edge(environment, state, node_idx)
 
-            # Drop the search if reaching action_idx=-1
-            if action_idx == -1:
+            # Drop the search if reaching edge_idx=-1
+            if edge_idx == -1:
+                history.truncate(history_length)
                 return
 
             # Get next_state after taking action
-            state = environment.step_from_index(
-                state,
-                change_action_perspective(state.current_player, action_idx,
-                                          environment.grid_size))
+            # NOTE: the action is pushed on the state which is restored by play_policy once the search is over
+            state = environment.push_from_index(
+                state, int(self.tree.edge_moves[edge_idx]))
 
             if state.done:
                 if state.winner == -1:
@@ -207,47 +244,51 @@ class MCTS:
                     state, environment.get_opponent(state.current_player))
 
             # Track (state, action pairs)
-            explored_branches.append((state_str, action_idx, reward))
+            explored_branches.append((node_idx, edge_idx, reward))
+
+        history.truncate(history_length)
 
         # print(f"Backing up {len(explored_branches)} branches")
 
         # Backup values
         # NOTE: add virtual loss when adding multithreading!
-        for state_str, action_idx, reward in reversed(explored_branches):
+        for node_idx, edge_idx, reward in reversed(explored_branches):
             # NOTE: make sure to reverse the propagated value!
+            self.tree.update(node_idx, edge_idx, reward)
 
-            current_state_record = self.tree[state_str]
-            current_action_record = current_state_record.actions[action_idx]
-            current_state_record.N_s += 1
-            current_action_record.N_sa += 1
-            current_action_record.W_sa += reward
-            current_action_record.Q_sa = current_action_record.W_sa / current_action_record.N_sa
-
-    def search(self, environment: QuoridorEnv, state: QuoridorState,
-               init_feature_planes):
-        # TODO: filter valid actions!
-
-        feature_planes = deepcopy(init_feature_planes)
+    def select_leaf(self,
+                    environment: QuoridorEnv,
+                    state: QuoridorState,
+                    history: FeatureHistory,
+                    virtual_loss: int = 0):
+        """Walks down the tree (pushing the selected actions on state) until reaching a terminal state or a state that is not in the tree yet
+
+        Args:
+            environment (QuoridorEnv): the game environment
+            state (QuoridorState): the searched state (restored by the caller with pop)
+            history (FeatureHistory): the instant planes of the previous states (left unchanged)
+            virtual_loss (int, optional): number of lost visits temporarily added to the traversed edges. Defaults to 0.
+
+        Returns:
+            tuple: (explored (node, edge) pairs, key of the leaf to expand (None for terminal states), state planes of the leaf, value of terminal states) or None if the search is dropped
+        """
+        # The planes pushed during the search are dropped once it is over
+        history_length = len(history)
+        try:
+            return self.walk_to_leaf(environment, state, history,
+                                     virtual_loss)
+        finally:
+            history.truncate(history_length)
+
+    def walk_to_leaf(self, environment: QuoridorEnv, state: QuoridorState,
+                     history: FeatureHistory, virtual_loss: int):
+        # Descent of select_leaf (which restores the history)
         explored_branches = []
-        branch_value = 0.0
-        # history = []
-        # last_state_t = 0
+        # Node reached through the last selected edge (-1 if it is not known yet)
+        child_idx = -1
 
         # Search the tree
-        # TODO: deal with None cases
         while True:
-            if state is None:
-                # THIS SHOULD NOT HAPPEN
-                print("MCTS: search ended with None state!")
-                # print(history)
-                # print(last_state_t)
-                # write_history(
-                #     os.path.abspath(
-                #         os.path.join(os.path.dirname(__file__),
-                #                      '../../data/test.txt')), history)
-                # exit()
-                break
-
             if state.done:
                 if state.winner == -1:
                     branch_value = 0.0
@@ -257,59 +298,203 @@ class MCTS:
                         branch_value = 1.0
                     else:
                         branch_value = -1.0
-                break
-
-            state_str = state.to_string(add_nb_walls=True,
-                                        add_current_player=True)
-            # history.append(
-            #     state.to_string(add_nb_walls=True, add_current_player=True))
-            # last_state_t = state.t
-            #print(f"Searching {state_str} with depth {len(feature_planes)}")
-            current_feature_plane = self.state_representation.generate_instant_planes(
-                state)
-            feature_planes.append(current_feature_plane)
-
-            # If the searched state is not in the tree, EXPAND
-            if state_str not in self.tree:
-                state_planes = self.state_representation.generate_state_planes(
-                    state, feature_planes)
-                p, v = self.model(
-                    state_planes.unsqueeze(0).to(self.model.device))
-                p = p[0]
-                self.tree[state_str].pi_s = p
-                branch_value = v
-                break
+                return explored_branches, None, None, branch_value
+
+            # The tree is keyed by the Zobrist key of the states
+            state_key = state.key
+            history.push(state)
+
+            # If the searched state is not in the tree, it must be EXPANDED
+            node_idx = child_idx
+            if node_idx == -1:
+                node_idx = self.tree.get_node(state_key)
+                if node_idx == -1:
+                    state_planes = history.state_planes(state)
+                    return explored_branches, state_key, state_planes, 0.0
+                if len(explored_branches) > 0:
+                    self.tree.set_child(explored_branches[-1][1], node_idx)
 
             # Otherwise, select and iterate
-            action_idx = self.puct_action(environment, state, state_str)
+            edge_idx = self.select_edge(environment, state, node_idx)
 
-            # Drop the search if reaching action_idx=-1
-            if action_idx == -1:
-                return
+            # Drop the search if reaching edge_idx=-1
+            if edge_idx == -1:
+                self.revert_virtual_loss(explored_branches, virtual_loss)
+                return None
+            if virtual_loss > 0:
+                self.tree.add_virtual_loss(node_idx, edge_idx, virtual_loss)
 
-            # Get next_state after taking action
-            state = environment.step_from_index(
-                state,
-                change_action_perspective(state.current_player, action_idx,
-                                          environment.grid_size))
+            # Get next_state after taking action (with the cached action and child node)
+            # NOTE: the action is pushed on the state which is restored by the caller once the search is over
+            state = environment.push_from_index(
+                state, int(self.tree.edge_moves[edge_idx]))
+            child_idx = int(self.tree.edge_children[edge_idx])
 
             # Track (state, action pairs)
-            explored_branches.append((state_str, action_idx))
-
-        # print(f"Backing up {len(explored_branches)} branches")
-
-        # Backup values
-        # NOTE: add virtual loss when adding multithreading!
-        for state_str, action_idx in reversed(explored_branches):
+            explored_branches.append((node_idx, edge_idx))
+
+    def evaluate(self, state_keys, batch_planes):
+        """Evaluates states with the model in a single forward pass (looking them up in the evaluation cache first if any)
+
+        Args:
+            state_keys: the keys of the states
+            batch_planes: the state planes of the states
+
+        Returns:
+            tuple[list[np.ndarray], np.ndarray]: the priors (over all actions) and the values of the states
+        """
+        priors = [None] * len(state_keys)
+        values = np.zeros(len(state_keys))
+        cache_keys = None
+        missing = list(range(len(state_keys)))
+        if self.evaluation_cache is not None:
+            cache_keys = [
+                self.evaluation_cache.get_key(state_key, state_planes)
+                for state_key, state_planes in zip(state_keys, batch_planes)
+            ]
+            missing = []
+            for i, cache_key in enumerate(cache_keys):
+                entry = self.evaluation_cache.get(cache_key)
+                if entry is None:
+                    missing.append(i)
+                else:
+                    priors[i], values[i] = entry
+
+        if len(missing) > 0:
+            p, v = self.model(
+                torch.stack([batch_planes[i]
+                             for i in missing]).to(self.model.device))
+            p = p.detach().cpu().numpy()
+            v = v.detach().cpu().numpy()[:, 0]
+            for j, i in enumerate(missing):
+                priors[i] = p[j]
+                values[i] = v[j]
+                if cache_keys is not None:
+                    self.evaluation_cache.put(cache_keys[i], p[j], float(v[j]))
+        return priors, values
+
+    def add_leaf(self, explored_branches, state_key: int, priors) -> int:
+        # Adds an evaluated leaf to the tree and links it to the edge it was reached from
+        node_idx = self.tree.add_node(state_key, priors)
+        if len(explored_branches) > 0:
+            self.tree.set_child(explored_branches[-1][1], node_idx)
+        return node_idx
+
+    def backup(self,
+               explored_branches,
+               branch_value: float,
+               virtual_loss: int = 0):
+        # Backup values (and remove the virtual loss added by select_leaf)
+        for node_idx, edge_idx in reversed(explored_branches):
             # NOTE: make sure to reverse the propagated value!
             branch_value *= -1.0
+            if virtual_loss > 0:
+                self.tree.revert_virtual_loss(node_idx, edge_idx,
+                                              virtual_loss)
+            self.tree.update(node_idx, edge_idx, branch_value)
 
-            current_state_record = self.tree[state_str]
-            current_action_record = current_state_record.actions[action_idx]
-            current_state_record.N_s += 1
-            current_action_record.N_sa += 1
-            current_action_record.W_sa += branch_value
-            current_action_record.Q_sa = current_action_record.W_sa / current_action_record.N_sa
+    def revert_virtual_loss(self, explored_branches, virtual_loss: int):
+        if virtual_loss > 0:
+            for node_idx, edge_idx in explored_branches:
+                self.tree.revert_virtual_loss(node_idx, edge_idx,
+                                              virtual_loss)
+
+    def search(self, environment: QuoridorEnv, state: QuoridorState,
+               history: FeatureHistory):
+        leaf = self.select_leaf(environment, state, history)
+        if leaf is None:
+            return
+        explored_branches, state_key, state_planes, branch_value = leaf
+
+        # EXPAND the leaf with the model evaluation
+        if state_key is not None:
+            p, v = self.evaluate([state_key], [state_planes])
+            self.add_leaf(explored_branches, state_key, p[0])
+            branch_value = float(v[0])
+
+        self.backup(explored_branches, branch_value)
+
+    def search_batch(self, environment: QuoridorEnv, state: QuoridorState,
+                     history: FeatureHistory, nb_leaves: int) -> int:
+        """Collects up to nb_leaves leaves (diversified with virtual loss), evaluates them in a single forward pass and backs them up
+
+        Args:
+            environment (QuoridorEnv): the game environment
+            state (QuoridorState): the searched state (left unchanged)
+            history (FeatureHistory): the instant planes of the previous states
+            nb_leaves (int): the maximum number of leaves
+
+        Returns:
+            int: the number of performed descents
+        """
+        leaves, batch_keys, batch_planes, nb_descents = self.collect_leaves(
+            environment, state, history, nb_leaves)
+
+        # EXPAND all the leaves at once
+        p, v = None, None
+        if len(batch_planes) > 0:
+            p, v = self.evaluate(batch_keys, batch_planes)
+        self.expand_leaves(leaves, p, v)
+
+        return nb_descents
+
+    def collect_leaves(self, environment: QuoridorEnv, state: QuoridorState,
+                       history: FeatureHistory, nb_leaves: int):
+        """Collects up to nb_leaves leaves (diversified with virtual loss) to be evaluated together (see expand_leaves)
+
+        Args:
+            environment (QuoridorEnv): the game environment
+            state (QuoridorState): the searched state (left unchanged)
+            history (FeatureHistory): the instant planes of the previous states
+            nb_leaves (int): the maximum number of leaves
+
+        Returns:
+            tuple: (leaves, keys of the states to evaluate, state planes of the states to evaluate, number of performed descents)
+        """
+        # Leaves are (explored branches, key of the leaf (None for terminal states), index in the evaluated batch, value of terminal states)
+        leaves = []
+        batch_indices = {}
+        batch_keys = []
+        batch_planes = []
+        nb_descents = 0
+        while nb_descents < nb_leaves:
+            nb_descents += 1
+            nb_undo_records = len(state.undo_records)
+            leaf = self.select_leaf(environment, state, history,
+                                    self.virtual_loss)
+            while len(state.undo_records) > nb_undo_records:
+                environment.pop(state)
+            if leaf is None:
+                continue
+            explored_branches, state_key, state_planes, branch_value = leaf
+            # Stop at the first collision since the next descents would most likely reach the same leaf
+            if state_key is not None and state_key in batch_indices:
+                self.revert_virtual_loss(explored_branches, self.virtual_loss)
+                break
+            batch_idx = -1
+            if state_key is not None:
+                batch_idx = len(batch_planes)
+                batch_indices[state_key] = batch_idx
+                batch_keys.append(state_key)
+                batch_planes.append(state_planes)
+            leaves.append(
+                (explored_branches, state_key, batch_idx, branch_value))
+
+        return leaves, batch_keys, batch_planes, nb_descents
+
+    def expand_leaves(self, leaves, priors, values):
+        """Expands the leaves returned by collect_leaves with their evaluations and backs them up
+
+        Args:
+            leaves: the leaves
+            priors: the priors of the evaluated states
+            values: the values of the evaluated states
+        """
+        for explored_branches, state_key, batch_idx, branch_value in leaves:
+            if state_key is not None:
+                self.add_leaf(explored_branches, state_key, priors[batch_idx])
+                branch_value = float(values[batch_idx])
+            self.backup(explored_branches, branch_value, self.virtual_loss)
 
     # Returns the play policy by running nb_simulations
     def play_policy(self,
@@ -323,34 +508,166 @@ class MCTS:
 
         start_time = time.time()
 
+        # The searches walk a single history of compact planes (only the most recent ones are needed)
+        history = self.state_representation.create_history(
+            previous_feature_planes[-self.state_representation.
+                                    time_consistency:])
+
+        # NOTE: with a non-zero temperature, the whole visit distribution matters so the search is never stopped early
+        stop_early = self.early_stopping and temperature == 0
+
+        # Searches are run by several threads sharing the tree (not supported with intermediate rewards)
+        if self.nb_threads > 1 and not intermediate_reward:
+            self.search_threads(environment, state, history, nb_simulations,
+                                start_time, limited_time, stop_early)
+            self.tree.enforce_budget(state.key)
+            return self.root_policy(state, temperature)
+
         # Perform nb_simulations (or stopped when the provided time is elapsed)
-        for i in range(nb_simulations):
+        i = 0
+        while i < nb_simulations:
             if limited_time is not None and time.time(
             ) - start_time > limited_time:
                 break
+            if stop_early and self.is_decided(state, nb_simulations - i):
+                break
 
-            # NOTE: deepcopy the state before performing a state, otherwise, it will be modified!
-            init_state = deepcopy(state)
+            # Leaves are evaluated by batches (not supported with intermediate rewards)
+            if self.nb_parallel_leaves > 1 and not intermediate_reward:
+                i += self.search_batch(
+                    environment, state, history,
+                    min(self.nb_parallel_leaves, nb_simulations - i))
+                self.tree.enforce_budget(state.key)
+                continue
+            i += 1
+
+            # NOTE: searches walk the state in place with push, so pop them afterwards to get back to the root state
+            nb_undo_records = len(state.undo_records)
             # print(
-            #     f"MCTS: searching state {init_state.to_string(add_nb_walls=True, add_current_player=True)}"
+            #     f"MCTS: searching state {state.to_string(add_nb_walls=True, add_current_player=True)}"
             # )
             if intermediate_reward:
-                self.search_intermediate(environment, init_state,
-                                         previous_feature_planes)
+                self.search_intermediate(environment, state, history)
             else:
-                self.search(environment, init_state, previous_feature_planes)
+                self.search(environment, state, history)
+            while len(state.undo_records) > nb_undo_records:
+                environment.pop(state)
+            self.tree.enforce_budget(state.key)
             # if (i + 1) % (nb_simulations // 10) == 0:
             #     print(
             #         f'Performed {i+1} simulations out of {nb_simulations} ({(i+1)/(nb_simulations)*100}%)'
             #     )
 
-        state_str = state.to_string(add_nb_walls=True, add_current_player=True)
-        state_record = self.tree[state_str]
-
-        # Collect policy from state_record
-        policy = np.zeros(self.nb_actions)
-        for i, action in state_record.actions.items():
-            policy[i] = action.P_sa
+        return self.root_policy(state, temperature)
+
+    def search_threads(self, environment: QuoridorEnv, state: QuoridorState,
+                       history: FeatureHistory, nb_simulations: int,
+                       start_time: float, limited_time: float,
+                       stop_early: bool):
+        """Runs nb_simulations searches with nb_threads threads sharing the tree (see search_thread)
+
+        Args:
+            environment (QuoridorEnv): the game environment
+            state (QuoridorState): the searched state (left unchanged)
+            history (FeatureHistory): the instant planes of the previous states
+            nb_simulations (int): the number of simulations
+            start_time (float): the time at which the search started
+            limited_time (float): the time after which no more simulation is started (None if not limited)
+            stop_early (bool): whether to stop once the most visited root action is decided
+        """
+        # The tree (and the environment) are only accessed with tree_lock, the model evaluations release it
+        tree_lock = threading.Lock()
+        # Number of started simulations
+        counter = [0]
+
+        def claim_simulation() -> bool:
+            # Called with tree_lock
+            if counter[0] >= nb_simulations:
+                return False
+            if limited_time is not None and time.time(
+            ) - start_time > limited_time:
+                return False
+            if stop_early and self.is_decided(state,
+                                              nb_simulations - counter[0]):
+                return False
+            counter[0] += 1
+            return True
+
+        # Each thread walks its own copy of the state and of the history
+        threads = [
+            threading.Thread(target=self.search_thread,
+                             args=(environment, state.copy(), history.copy(),
+                                   tree_lock, claim_simulation))
+            for _ in range(self.nb_threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def search_thread(self, environment: QuoridorEnv, state: QuoridorState,
+                      history: FeatureHistory, tree_lock: threading.Lock,
+                      claim_simulation):
+        # Loop of a search thread: the descents and backups hold tree_lock while the leaves are evaluated without it
+        # NOTE: the virtual loss added along the descents keeps the other threads away from the pending leaves
+        while True:
+            with tree_lock:
+                if not claim_simulation():
+                    return
+                leaf = self.select_leaf(environment, state, history,
+                                        self.virtual_loss)
+                while len(state.undo_records) > 0:
+                    environment.pop(state)
+            if leaf is None:
+                continue
+            explored_branches, state_key, state_planes, branch_value = leaf
+
+            if state_key is not None:
+                p, v = self.evaluate([state_key], [state_planes])
+                branch_value = float(v[0])
+
+            with tree_lock:
+                if state_key is not None:
+                    # Another thread may have expanded the same leaf in the meantime
+                    node_idx = self.tree.get_node(state_key)
+                    if node_idx == -1:
+                        self.add_leaf(explored_branches, state_key, p[0])
+                    elif len(explored_branches) > 0:
+                        self.tree.set_child(explored_branches[-1][1],
+                                            node_idx)
+                self.backup(explored_branches, branch_value,
+                            self.virtual_loss)
+
+    def is_decided(self, state: QuoridorState,
+                   nb_remaining_simulations: int) -> bool:
+        # Whether the most visited root action cannot be overtaken by any other within the remaining simulations
+        root_idx = self.tree.get_node(state.key)
+        if root_idx == -1 or not self.tree.has_edges(root_idx):
+            return False
+        root_N = self.tree.edge_N[self.tree.get_edges(root_idx)]
+        if len(root_N) < 2:
+            return True
+        second_N, first_N = np.partition(root_N, -2)[-2:]
+        return first_N - second_N > nb_remaining_simulations
+
+    def root_visits(self, state: QuoridorState) -> np.ndarray:
+        # Returns the visit counts of the root actions (indexed by action indices from the perspective of the current player)
+        visits = np.zeros(self.nb_actions)
+        root_idx = self.tree.get_node(state.key)
+        if root_idx != -1:
+            edges = self.tree.get_edges(root_idx)
+            visits[self.tree.edge_actions[edges]] = self.tree.edge_N[edges]
+        return visits
+
+    def root_policy(self, state: QuoridorState, temperature: float = 1):
+        # Collect policy from the visit counts of the root edges (the criterion early stopping and RootParallelMCTS rely on)
+        policy = self.root_visits(state)
+        if not np.any(policy):
+            # No simulation reached the root edges, fall back on their priors
+            root_idx = self.tree.get_node(state.key)
+            if root_idx != -1:
+                edges = self.tree.get_edges(root_idx)
+                policy[self.tree.edge_actions[edges]] = self.tree.edge_P[edges]
 
         # If the temperature is zero, it is equivalent to returning the best action (i.e. deterministic policy)
         if temperature == 0:
@@ -0,0 +1,297 @@
+import numpy as np
+
+# Approximate number of bytes used by a node (node arrays, key and priors references, index entry) and by an edge (edge arrays)
+NODE_BYTES = 3 * 8 + 2 * 8 + 128
+EDGE_BYTES = 7 * 8
+# Fraction of the node budget kept when the tree is shrunk (so that it is not shrunk at every simulation)
+SHRINK_RATIO = 0.75
+
+
+class MCTSTree:
+    """Compact storage of an MCTS tree in contiguous NumPy arrays
+
+    Nodes are indexed by the Zobrist keys of their states (see node_indices). The edges (i.e. actions)
+    of a node are stored contiguously in the edge arrays, from edge_start to edge_start + edge_count.
+    Edges are only created at the first selection of a node, until then the priors given
+    by the model at expansion are kept in node_priors. Edges store the action both from the perspective
+    of the node player (edge_actions, used for the policy) and as pushed on the state (edge_moves),
+    so that traversals never regenerate nor convert actions. Edges also record the node they lead to
+    (once it has been reached) so that the tree can be pruned to the subtree of a new root (see prune).
+
+    The tree can be given a budget (number of nodes and/or memory) beyond which the least visited nodes
+    of the deepest levels are evicted and their slots recycled (see enforce_budget).
+    """
+
+    def __init__(self,
+                 initial_capacity: int = 1024,
+                 max_nodes: int = None,
+                 max_memory_mb: float = None) -> None:
+        self.max_nodes = max_nodes
+        self.max_memory_mb = max_memory_mb
+        # Eviction metrics
+        self.nb_shrinks = 0
+        self.nb_evicted_nodes = 0
+        self.reset(initial_capacity)
+
+    def reset(self, initial_capacity: int = 1024):
+        # Nodes
+        self.node_indices = {}
+        self.node_keys = []
+        self.nb_nodes = 0
+        self.node_N = np.zeros(initial_capacity, dtype=np.int64)
+        self.edge_start = np.zeros(initial_capacity, dtype=np.int64)
+        # -1 while the edges of the node have not been created
+        self.edge_count = np.full(initial_capacity, -1, dtype=np.int64)
+        self.node_priors = []
+        # Number of bytes of the priors kept until the edges are created
+        self.priors_bytes = 0
+
+        # Edges
+        self.nb_edges = 0
+        self.edge_actions = np.zeros(initial_capacity, dtype=np.int64)
+        self.edge_moves = np.zeros(initial_capacity, dtype=np.int64)
+        # -1 while the child node has not been reached (or for terminal states)
+        self.edge_children = np.full(initial_capacity, -1, dtype=np.int64)
+        self.edge_N = np.zeros(initial_capacity, dtype=np.int64)
+        self.edge_W = np.zeros(initial_capacity, dtype=np.float64)
+        self.edge_Q = np.zeros(initial_capacity, dtype=np.float64)
+        self.edge_P = np.zeros(initial_capacity, dtype=np.float64)
+
+    def __contains__(self, state_key: int) -> bool:
+        return state_key in self.node_indices
+
+    def __len__(self) -> int:
+        return self.nb_nodes
+
+    def get_node(self, state_key: int) -> int:
+        """Returns the index of the node of a state (-1 if it is not in the tree)"""
+        return self.node_indices.get(state_key, -1)
+
+    def add_node(self, state_key: int, priors: np.ndarray) -> int:
+        """Adds an expanded node to the tree
+
+        Args:
+            state_key (int): the key of the state
+            priors (np.ndarray): the action priors given by the model (over all actions)
+
+        Returns:
+            int: the index of the new node
+        """
+        if self.nb_nodes == len(self.node_N):
+            self.node_N, self.edge_start, self.edge_count = self.grow(
+                [self.node_N, self.edge_start, self.edge_count], [0, 0, -1])
+        node_idx = self.nb_nodes
+        self.nb_nodes += 1
+        self.node_indices[state_key] = node_idx
+        self.node_keys.append(state_key)
+        self.node_priors.append(priors)
+        self.priors_bytes += priors.nbytes
+        return node_idx
+
+    def has_edges(self, node_idx: int) -> bool:
+        return self.edge_count[node_idx] >= 0
+
+    def add_edges(self, node_idx: int, action_indices, move_indices,
+                  priors) -> None:
+        """Creates the edges of a node and drops its pending priors
+
+        Args:
+            node_idx (int): the index of the node
+            action_indices: the indices of the actions (from the perspective of the node player)
+            move_indices: the indices of the same actions as pushed on the state (i.e. from the perspective of player 0)
+            priors: the (normalized) priors of the actions
+        """
+        nb_new_edges = len(action_indices)
+        if self.nb_edges + nb_new_edges > len(self.edge_N):
+            self.edge_actions, self.edge_moves, self.edge_children, self.edge_N, self.edge_W, self.edge_Q, self.edge_P = self.grow(
+                [
+                    self.edge_actions, self.edge_moves, self.edge_children,
+                    self.edge_N, self.edge_W, self.edge_Q, self.edge_P
+                ], [0, 0, -1, 0, 0, 0, 0],
+                min_size=self.nb_edges + nb_new_edges)
+        start = self.nb_edges
+        end = start + nb_new_edges
+        self.edge_actions[start:end] = action_indices
+        self.edge_moves[start:end] = move_indices
+        self.edge_P[start:end] = priors
+        self.edge_start[node_idx] = start
+        self.edge_count[node_idx] = nb_new_edges
+        self.nb_edges = end
+        self.priors_bytes -= self.node_priors[node_idx].nbytes
+        self.node_priors[node_idx] = None
+
+    def get_edges(self, node_idx: int) -> slice:
+        """Returns the slice of the edge arrays holding the edges of a node"""
+        start = self.edge_start[node_idx]
+        return slice(start, start + max(self.edge_count[node_idx], 0))
+
+    def set_child(self, edge_idx: int, node_idx: int) -> None:
+        # Records the node reached through an edge
+        self.edge_children[edge_idx] = node_idx
+
+    def prune(self, root_key: int) -> None:
+        """Keeps only the nodes reachable from the node of root_key (the whole tree is reset if it is not in the tree).
+        The kept nodes and edges are compacted at the beginning of the arrays.
+
+        Args:
+            root_key (int): the key of the new root state
+        """
+        root_idx = self.get_node(root_key)
+        if root_idx == -1:
+            self.reset(len(self.node_N))
+            return
+        self.compact(self.get_reachable_nodes(root_idx)[0])
+
+    def get_reachable_nodes(self, root_idx: int):
+        # Returns the nodes reachable from a root (in breadth-first order) along with their depths
+        new_indices = {root_idx: 0}
+        kept_nodes = [root_idx]
+        depths = [0]
+        k = 0
+        while k < len(kept_nodes):
+            for child_idx in self.edge_children[self.get_edges(
+                    kept_nodes[k])].tolist():
+                if child_idx >= 0 and child_idx not in new_indices:
+                    new_indices[child_idx] = len(kept_nodes)
+                    kept_nodes.append(child_idx)
+                    depths.append(depths[k] + 1)
+            k += 1
+        return kept_nodes, depths
+
+    def memory_usage(self) -> int:
+        # Approximate number of bytes used by the nodes and edges of the tree
+        return self.nb_nodes * NODE_BYTES + self.nb_edges * EDGE_BYTES + self.priors_bytes
+
+    def enforce_budget(self, root_key: int) -> None:
+        """Shrinks the tree if it exceeds its budget.
+        NOTE: only call this between searches since the pending leaves of a search reference nodes by index.
+
+        Args:
+            root_key (int): the key of the root state (which is always kept)
+        """
+        nb_kept_nodes = self.nb_nodes
+        if self.max_nodes is not None and self.nb_nodes > self.max_nodes:
+            nb_kept_nodes = int(SHRINK_RATIO * self.max_nodes)
+        if self.max_memory_mb is not None:
+            memory_usage = self.memory_usage()
+            max_memory = self.max_memory_mb * 2**20
+            if memory_usage > max_memory:
+                nb_kept_nodes = min(
+                    nb_kept_nodes,
+                    int(SHRINK_RATIO * self.nb_nodes * max_memory /
+                        memory_usage))
+        if nb_kept_nodes < self.nb_nodes:
+            self.shrink(root_key, nb_kept_nodes)
+
+    def shrink(self, root_key: int, nb_kept_nodes: int) -> None:
+        """Evicts the least visited nodes of the deepest levels (along with the nodes only reachable through them)
+        so that at most nb_kept_nodes nodes remain. The slots of the evicted nodes and edges are recycled.
+
+        Args:
+            root_key (int): the key of the root state (which is always kept)
+            nb_kept_nodes (int): the maximum number of kept nodes
+        """
+        root_idx = self.get_node(root_key)
+        nb_nodes = self.nb_nodes
+        if root_idx == -1:
+            self.reset(len(self.node_N))
+        else:
+            # Nodes are kept level by level (most visited first) so that the parent of a kept node is always kept
+            reachable_nodes, depths = self.get_reachable_nodes(root_idx)
+            reachable_nodes = np.array(reachable_nodes)
+            order = np.lexsort((-self.node_N[reachable_nodes], depths))
+            self.compact(reachable_nodes[order[:max(nb_kept_nodes, 1)]])
+        self.nb_shrinks += 1
+        self.nb_evicted_nodes += nb_nodes - self.nb_nodes
+
+    def compact(self, kept_nodes) -> None:
+        # Keeps only the provided nodes (in this order, the links to the other nodes are dropped) and their edges
+        kept_nodes = np.array(kept_nodes)
+
+        # Old index of each kept edge (edges of a node stay contiguous)
+        edge_counts = np.maximum(self.edge_count[kept_nodes], 0)
+        nb_kept_edges = int(np.sum(edge_counts))
+        new_starts = np.cumsum(edge_counts) - edge_counts
+        kept_edges = np.arange(nb_kept_edges) + np.repeat(
+            self.edge_start[kept_nodes] - new_starts, edge_counts)
+
+        # Map the old node indices to the new ones
+        node_mapping = np.full(self.nb_nodes, -1, dtype=np.int64)
+        node_mapping[kept_nodes] = np.arange(len(kept_nodes))
+        kept_children = self.edge_children[kept_edges]
+        kept_children = np.where(kept_children >= 0,
+                                 node_mapping[kept_children], -1)
+
+        node_keys = [self.node_keys[node_idx] for node_idx in kept_nodes]
+        node_priors = [self.node_priors[node_idx] for node_idx in kept_nodes]
+        priors_bytes = sum(priors.nbytes for priors in node_priors
+                           if priors is not None)
+        node_N = self.node_N[kept_nodes]
+        edge_count = self.edge_count[kept_nodes]
+        edge_arrays = [
+            array[kept_edges]
+            for array in (self.edge_actions, self.edge_moves, self.edge_N,
+                          self.edge_W, self.edge_Q, self.edge_P)
+        ]
+
+        # The slots of the dropped nodes and edges are recycled (cleared for the next add_node/add_edges)
+        nb_nodes, nb_edges = self.nb_nodes, self.nb_edges
+        self.nb_nodes = len(kept_nodes)
+        self.node_keys = node_keys
+        self.node_indices = {
+            state_key: node_idx
+            for node_idx, state_key in enumerate(node_keys)
+        }
+        self.node_priors = node_priors
+        self.priors_bytes = priors_bytes
+        self.node_N[:self.nb_nodes] = node_N
+        self.node_N[self.nb_nodes:nb_nodes] = 0
+        self.edge_start[:self.nb_nodes] = new_starts
+        self.edge_count[:self.nb_nodes] = edge_count
+        self.edge_count[self.nb_nodes:nb_nodes] = -1
+
+        self.nb_edges = nb_kept_edges
+        self.edge_children[:nb_kept_edges] = kept_children
+        self.edge_children[nb_kept_edges:nb_edges] = -1
+        for array, kept_values in zip(
+            (self.edge_actions, self.edge_moves, self.edge_N, self.edge_W,
+             self.edge_Q, self.edge_P), edge_arrays):
+            array[:nb_kept_edges] = kept_values
+            array[nb_kept_edges:nb_edges] = 0
+
+    def update(self, node_idx: int, edge_idx: int, value: float) -> None:
+        # Backs a value up through an edge
+        self.node_N[node_idx] += 1
+        self.edge_N[edge_idx] += 1
+        self.edge_W[edge_idx] += value
+        self.edge_Q[edge_idx] = self.edge_W[edge_idx] / self.edge_N[edge_idx]
+
+    def add_virtual_loss(self, node_idx: int, edge_idx: int,
+                         virtual_loss: int) -> None:
+        # Counts virtual_loss lost visits through an edge so that the following descents explore other paths
+        self.node_N[node_idx] += virtual_loss
+        self.edge_N[edge_idx] += virtual_loss
+        self.edge_W[edge_idx] -= virtual_loss
+        self.edge_Q[edge_idx] = self.edge_W[edge_idx] / self.edge_N[edge_idx]
+
+    def revert_virtual_loss(self, node_idx: int, edge_idx: int,
+                            virtual_loss: int) -> None:
+        self.node_N[node_idx] -= virtual_loss
+        self.edge_N[edge_idx] -= virtual_loss
+        self.edge_W[edge_idx] += virtual_loss
+        self.edge_Q[edge_idx] = self.edge_W[edge_idx] / self.edge_N[
+            edge_idx] if self.edge_N[edge_idx] > 0 else 0.0
+
+    def description(self) -> str:
+        return f"MCTSTree: nodes={self.nb_nodes}; edges={self.nb_edges}; memory={self.memory_usage() / 2**20:.2f}MB; max_nodes={self.max_nodes}; max_memory_mb={self.max_memory_mb}; shrinks={self.nb_shrinks}; evicted nodes={self.nb_evicted_nodes}"
+
+    @staticmethod
+    def grow(arrays, fill_values, min_size: int = 0):
+        # Doubles the capacity of the provided arrays (at least up to min_size)
+        new_size = max(2 * len(arrays[0]), min_size)
+        new_arrays = []
+        for array, fill_value in zip(arrays, fill_values):
+            new_array = np.full(new_size, fill_value, dtype=array.dtype)
+            new_array[:len(array)] = array
+            new_arrays.append(new_array)
+        return new_arrays
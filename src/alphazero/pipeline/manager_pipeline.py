@@ -72,6 +72,13 @@ if __name__ == "__main__":
         verbose=args.verbose,
         display_mode=args.display_mode,
         intermediate_reward=args.intermediate_reward,
+        nb_parallel_leaves=args.nb_parallel_leaves,
+        evaluation_cache_mb=args.evaluation_cache_mb,
+        inference_batch_size=args.inference_batch_size,
+        inference_max_wait_us=args.inference_max_wait_us,
+        nb_lockstep_games=args.nb_lockstep_games,
+        max_tree_nodes=args.max_tree_nodes,
+        max_tree_mb=args.max_tree_mb,
     )
 
     manager = Manager(device,
@@ -14,20 +14,25 @@ sys.path.insert(
 from environment import QuoridorEnv, QuoridorState, QuoridorConfig
 from interactive import CELL_SIZE, INNER_CELL_SIZE, EMPTY_CELL_COLOR, PAWN_0_COLOR, PAWN_1_COLOR, SIZE, WALL_THICKNESS, FPS, WALL_COLOR
 from interactive import draw_gui, draw_board, draw_state
-from alphazero import QuoridorModel, QuoridorRepresentation, MCTS, ModelConfig
+from alphazero import QuoridorModel, QuoridorRepresentation, MCTS, ModelConfig, TimeManager, RootParallelMCTS
 from alphazero.pipeline import get_parser
 
 
 def play_model(mcts: MCTS, feature_planes, environment: QuoridorEnv,
                state: QuoridorState, representation: QuoridorRepresentation,
-               limited_time: float):
+               limited_time: float, time_manager: TimeManager = None):
     if state.done:
         return
+    # The search time is taken from the game clock if any
+    if time_manager is not None:
+        limited_time = time_manager.start_move(environment, state)
     action_idx, _ = mcts.select_action(environment,
                                        state,
                                        feature_planes,
                                        limited_time=limited_time,
                                        temperature=0.0)
+    if time_manager is not None:
+        time_manager.end_move()
     state = environment.step_from_index(state, action_idx)
 
     # Add the new feature planes to existing feature planes
@@ -38,7 +43,8 @@ def play_model(mcts: MCTS, feature_planes, environment: QuoridorEnv,
 def handle_click(environment: QuoridorEnv, state: QuoridorState,
                  action_mode: int, mcts: MCTS, feature_planes,
                  representation: QuoridorRepresentation,
-                 limited_time: float) -> None:
+                 limited_time: float,
+                 time_manager: TimeManager = None) -> None:
     # Prevents player from taking actions if the game is over or it is not its turn
     if state.done or state.current_player != 0:
         return None
@@ -56,7 +62,7 @@ def handle_click(environment: QuoridorEnv, state: QuoridorState,
             feature_planes.append(current_feature_planes)
 
             play_model(mcts, feature_planes, environment, state,
-                       representation, limited_time)
+                       representation, limited_time, time_manager)
         else:
             print(
                 f"QuoridorEnv: cannot move player {state.current_player} to target position {target_position}"
@@ -75,7 +81,7 @@ def handle_click(environment: QuoridorEnv, state: QuoridorState,
             feature_planes.append(current_feature_planes)
 
             play_model(mcts, feature_planes, environment, state,
-                       representation, limited_time)
+                       representation, limited_time, time_manager)
         else:
             print(
                 f"QuoridorEnv: cannot place wall for player {state.current_player} to target position {target_position} and direction {direction}"
@@ -138,9 +144,22 @@ def main():
     # Initialize the feature planes that are generated from each visited state
     feature_planes = []
 
-    # Initialize the MCTS (and the limited search time)
+    # Initialize the MCTS (and the limited search time, or the game clock if provided)
     limited_search_time = 2.0
-    mcts = MCTS(game_config, model, representation)
+    time_manager = TimeManager(
+        game_config, args.game_time) if args.game_time is not None else None
+    if args.nb_root_processes > 1:
+        mcts = RootParallelMCTS(game_config,
+                                model,
+                                representation,
+                                nb_processes=args.nb_root_processes,
+                                nb_threads=args.nb_search_threads)
+    else:
+        mcts = MCTS(game_config,
+                    model,
+                    representation,
+                    early_stopping=time_manager is not None,
+                    nb_threads=args.nb_search_threads)
 
     # Initialize action mode
     action_mode = 0
@@ -199,7 +218,7 @@ def main():
             elif event.type == pg.MOUSEBUTTONDOWN:
                 handle_click(environment, state, action_mode, mcts,
                              feature_planes, representation,
-                             limited_search_time)
+                             limited_search_time, time_manager)
             elif event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
                 action_mode = (action_mode + 1) % 3
         # draw
@@ -212,6 +231,8 @@ def main():
         pg.display.flip()
 
     pg.quit()
+    if args.nb_root_processes > 1:
+        mcts.close()
 
 
 if __name__ == "__main__":
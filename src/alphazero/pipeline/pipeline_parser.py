@@ -68,8 +68,8 @@ def get_parser() -> ArgumentParser:
     selfplay_group.add_argument(
         '--max_workers',
         type=int,
-        default=4,
-        help='number of parallel workers (DISABLED for now)')
+        default=1,
+        help='number of processes playing self-play games in parallel')
     selfplay_group.add_argument(
         '--initial_temperature',
         type=float,
@@ -89,11 +89,81 @@ def get_parser() -> ArgumentParser:
         help=
         "limited time in seconds during which a full MCTS can be performed (by default None)"
     )
+    selfplay_group.add_argument(
+        '--game_time',
+        type=float,
+        default=None,
+        help=
+        "total search time in seconds of the model over a game played with the GUI (by default, each move is searched for 2 seconds)"
+    )
+    selfplay_group.add_argument(
+        '--nb_search_threads',
+        type=int,
+        default=1,
+        help=
+        "number of threads searching the tree of the model concurrently in a game played with the GUI"
+    )
+    selfplay_group.add_argument(
+        '--nb_root_processes',
+        type=int,
+        default=1,
+        help=
+        "number of processes searching independent trees whose root visit counts are merged in a game played with the GUI"
+    )
     selfplay_group.add_argument(
         '--intermediate_reward',
         type=bool,
         default=False,
         help="whether to use handcrafted intermediate rewards or not")
+    selfplay_group.add_argument(
+        '--nb_parallel_leaves',
+        type=int,
+        default=1,
+        help=
+        "number of leaves evaluated at once by the model during MCTS (using virtual loss)"
+    )
+    selfplay_group.add_argument(
+        '--evaluation_cache_mb',
+        type=float,
+        default=256,
+        help=
+        "memory cap (in MB) of the cache of model evaluations shared by the self-play games (0 to disable it)"
+    )
+    selfplay_group.add_argument(
+        '--inference_batch_size',
+        type=int,
+        default=0,
+        help=
+        "maximum batch size of the inference server evaluating the leaves of all the parallel workers (0 to let each worker evaluate its own leaves)"
+    )
+    selfplay_group.add_argument(
+        '--inference_max_wait_us',
+        type=int,
+        default=500,
+        help=
+        "maximum time (in microseconds) the inference server waits for more requests before evaluating a batch"
+    )
+    selfplay_group.add_argument(
+        '--nb_lockstep_games',
+        type=int,
+        default=1,
+        help=
+        "number of games advanced together by a single process, their leaves being evaluated in a single forward pass"
+    )
+    selfplay_group.add_argument(
+        '--max_tree_nodes',
+        type=int,
+        default=None,
+        help=
+        "maximum number of nodes of the MCTS tree of a game before its least visited deepest nodes are evicted (by default None)"
+    )
+    selfplay_group.add_argument(
+        '--max_tree_mb',
+        type=float,
+        default=None,
+        help=
+        "maximum memory (in MB) of the MCTS tree of a game before its least visited deepest nodes are evicted (by default None)"
+    )
     selfplay_group.add_argument(
         '--model_path',
         type=str,
@@ -64,7 +64,14 @@ if __name__ == "__main__":
         str_history=args.str_history,
         verbose=args.verbose,
         display_mode=args.display_mode,
-        intermediate_reward=args.intermediate_reward)
+        intermediate_reward=args.intermediate_reward,
+        nb_parallel_leaves=args.nb_parallel_leaves,
+        evaluation_cache_mb=args.evaluation_cache_mb,
+        inference_batch_size=args.inference_batch_size,
+        inference_max_wait_us=args.inference_max_wait_us,
+        nb_lockstep_games=args.nb_lockstep_games,
+        max_tree_nodes=args.max_tree_nodes,
+        max_tree_mb=args.max_tree_mb)
 
     self_player = SelfPlayer(init_model, game_config, environment,
                              representation, dir_path, selfplay_config)
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 from torch import Tensor
 from environment import QuoridorState, QuoridorConfig
@@ -34,9 +35,10 @@ class QuoridorRepresentation:
             feature_planes[i, pos[0], pos[1]] = 1.0
 
         # Set walls
-        feature_planes[2, :self.grid_size - 1, :self.grid_size -
-                       1] = torch.from_numpy(state.walls) + torch.ones(
-                           (self.grid_size - 1, self.grid_size - 1))
+        feature_planes[2, :self.grid_size -
+                       1, :self.grid_size - 1] = torch.from_numpy(
+                           np.asarray(state.walls)) + torch.ones(
+                               (self.grid_size - 1, self.grid_size - 1))
 
         return feature_planes
 
@@ -79,5 +81,110 @@ class QuoridorRepresentation:
         # TODO: check rotation axes!
         return torch.rot90(state_planes, k=2, dims=(1, 2))
 
+    def create_history(self, feature_planes=()):
+        """Creates the history of instant planes used by searches (see FeatureHistory)
+
+        Args:
+            feature_planes (optional): the instant planes (as returned by generate_instant_planes) of the previous states. Defaults to ().
+
+        Returns:
+            FeatureHistory: the history
+        """
+        return FeatureHistory(self, feature_planes)
+
     def description(self) -> str:
         return f"Representation: time_consistency={self.time_consistency}; features={self.nb_features}; constants={self.nb_constants}; total channels={self.nb_channels}"
+
+
+class FeatureHistory:
+    """Stack of compact (int8) instant planes walked along with the searched states
+
+    Planes are pushed for every state visited by a search and the stack is truncated back
+    once the search is over, so that the history of the game is never copied. Planes are
+    stored already rotated (see generate_state_planes) so that the state planes of the
+    current state only require a slice of the last time_consistency planes.
+    """
+
+    def __init__(self,
+                 representation: QuoridorRepresentation,
+                 feature_planes=(),
+                 initial_capacity: int = 64) -> None:
+        self.representation = representation
+        self.grid_size = representation.grid_size
+        self.time_consistency = representation.time_consistency
+        self.planes = np.zeros(
+            (max(initial_capacity, len(feature_planes)), 3, self.grid_size,
+             self.grid_size),
+            dtype=np.int8)
+        self.length = 0
+        for feature_plane in feature_planes:
+            self.push_planes(
+                np.flip(np.asarray(feature_plane), axis=(1, 2)).astype(np.int8))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def reserve(self) -> np.ndarray:
+        # Returns the planes of the next slot (doubling the capacity if needed)
+        if self.length == len(self.planes):
+            self.planes = np.concatenate(
+                [self.planes, np.zeros_like(self.planes)])
+        return self.planes[self.length]
+
+    def push_planes(self, planes: np.ndarray):
+        self.reserve()[:] = planes
+        self.length += 1
+
+    def push(self, state: QuoridorState):
+        """Pushes the (rotated) instant planes of a state"""
+        planes = self.reserve()
+        planes[:2] = 0
+        for i, pos in enumerate(state.player_positions):
+            planes[i, self.grid_size - 1 - pos[0],
+                   self.grid_size - 1 - pos[1]] = 1
+        planes[2, 0, :] = 0
+        planes[2, :, 0] = 0
+        planes[2, 1:, 1:] = np.asarray(state.walls)[::-1, ::-1] + 1
+        self.length += 1
+
+    def copy(self):
+        # Returns an independent copy of the history (e.g. for another search thread)
+        new_history = self.__class__.__new__(self.__class__)
+        new_history.__dict__.update(self.__dict__)
+        new_history.planes = self.planes.copy()
+        return new_history
+
+    def truncate(self, length: int):
+        # Drops the planes pushed after the history had the provided length
+        self.length = length
+
+    def state_planes(self, state: QuoridorState) -> Tensor:
+        """Generates the state planes of the state whose planes were pushed last (see generate_state_planes)
+
+        Args:
+            state (QuoridorState): the current state
+
+        Returns:
+            Tensor: the state planes
+        """
+        representation = self.representation
+        state_planes = np.empty(
+            (representation.nb_channels, self.grid_size, self.grid_size),
+            dtype=np.float32)
+        # If some are missing, they are padded with 0
+        nb_recent_features = min(self.time_consistency, self.length)
+        nb_padded_channels = (self.time_consistency -
+                              nb_recent_features) * representation.nb_features
+        state_planes[:nb_padded_channels] = 0.0
+        state_planes[nb_padded_channels:self.time_consistency *
+                     representation.nb_features] = self.planes[
+                         self.length - nb_recent_features:self.length].reshape(
+                             -1, self.grid_size, self.grid_size)
+        # Add constant-valued features (invariant by rotation)
+        constants_idx = self.time_consistency * representation.nb_features
+        state_planes[constants_idx] = state.current_player
+        state_planes[constants_idx + 1] = representation.max_walls - state.nb_walls[
+            state.current_player]
+        state_planes[constants_idx + 2] = representation.max_walls - state.nb_walls[
+            (state.current_player + 1) % 2]
+        return torch.from_numpy(state_planes)
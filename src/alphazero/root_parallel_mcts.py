@@ -0,0 +1,153 @@
+import pickle
+import queue
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from alphazero import QuoridorRepresentation, QuoridorModel, MCTS
+from environment import QuoridorState, QuoridorEnv, QuoridorConfig
+from utils import change_action_perspective
+
+
+class RootParallelMCTS:
+    """Root-parallel search: nb_processes processes each search an independent tree from the same root
+    (diversified by the root noise of their own random seed) and the visit counts of the root actions
+    are summed to select the action.
+
+    The processes (and their trees) persist from one move to the next, call close once done.
+    """
+
+    def __init__(self,
+                 game_config: QuoridorConfig,
+                 model: QuoridorModel,
+                 state_representation: QuoridorRepresentation,
+                 nb_processes: int = 4,
+                 seed: int = None,
+                 **mcts_kwargs) -> None:
+        self.nb_actions = game_config.nb_actions
+        self.nb_processes = nb_processes
+        self.time_consistency = state_representation.time_consistency
+
+        # The processes read the weights of the model from shared memory
+        model.share_memory()
+        context = mp.get_context("spawn")
+        self.command_queues = [context.Queue() for _ in range(nb_processes)]
+        self.result_queue = context.Queue()
+        if seed is None:
+            seed = np.random.randint(2**31 - nb_processes)
+        self.processes = [
+            context.Process(target=root_parallel_worker,
+                            args=(seed + process_idx, game_config, model,
+                                  state_representation, mcts_kwargs,
+                                  self.command_queues[process_idx],
+                                  self.result_queue))
+            for process_idx in range(nb_processes)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def select_action(self,
+                      environment: QuoridorEnv,
+                      state: QuoridorState,
+                      previous_feature_planes,
+                      nb_simulations: int = 800,
+                      temperature: float = 1,
+                      limited_time: float = None,
+                      intermediate_reward=False,
+                      root_noise=True):
+        """Selects an action from the root visit counts summed over the processes (same arguments as MCTS.select_action)
+
+        Args:
+            environment (QuoridorEnv): the game environment
+            state (QuoridorState): the current state
+            previous_feature_planes: the instant planes of the previous states
+            nb_simulations (int, optional): the number of simulations of each process. Defaults to 800.
+            temperature (float, optional): the temperature applied to the merged visit counts. Defaults to 1.
+            limited_time (float, optional): the search time of each process. Defaults to None.
+            intermediate_reward (bool, optional): whether to use intermediate rewards. Defaults to False.
+            root_noise (bool, optional): whether to mix Dirichlet noise into the root priors (which diversifies the trees). Defaults to True.
+
+        Returns:
+            tuple[int, np.ndarray]: the index of the action and the policy
+        """
+        # NOTE: commands are pickled so that their tensors are not sent through shared memory (one file descriptor each)
+        command = pickle.dumps(
+            (state.copy(), previous_feature_planes[-self.time_consistency:],
+             nb_simulations, limited_time, intermediate_reward, root_noise),
+            protocol=pickle.HIGHEST_PROTOCOL)
+        for command_queue in self.command_queues:
+            command_queue.put(command)
+        visits = np.zeros(self.nb_actions)
+        nb_results = 0
+        while nb_results < self.nb_processes:
+            try:
+                visits += self.result_queue.get(timeout=1.0)
+            except queue.Empty:
+                # A failed process would never send its result
+                if any(process.exitcode is not None
+                       for process in self.processes):
+                    for process in self.processes:
+                        process.terminate()
+                    raise RuntimeError("RootParallelMCTS: a process failed")
+                continue
+            nb_results += 1
+
+        # If the temperature is zero, it is equivalent to returning the most visited action (as MCTS.root_policy)
+        if temperature == 0:
+            policy = np.zeros(self.nb_actions, dtype=np.float32)
+            policy[np.argmax(visits)] = 1.0
+        else:
+            policy = np.power(visits, 1.0 / temperature, dtype=np.float32)
+            policy /= np.sum(policy)
+
+        return change_action_perspective(
+            state.current_player,
+            int(np.random.choice(np.arange(self.nb_actions), p=policy)),
+            grid_size=environment.grid_size), policy
+
+    def close(self):
+        # The processes stop once they read None
+        for command_queue in self.command_queues:
+            command_queue.put(None)
+        for process in self.processes:
+            process.join()
+
+    def description(self) -> str:
+        return f"RootParallelMCTS: processes={self.nb_processes}"
+
+
+def root_parallel_worker(seed: int, game_config: QuoridorConfig,
+                         model: QuoridorModel,
+                         state_representation: QuoridorRepresentation,
+                         mcts_kwargs: dict, command_queue, result_queue):
+    """Loop of a process of RootParallelMCTS: searches the states read from command_queue (until reading None)
+    and sends the root visit counts to result_queue
+
+    Args:
+        seed (int): the seed of the random generator of the process
+        game_config (QuoridorConfig): the game config
+        model (QuoridorModel): the model (whose weights are in shared memory)
+        state_representation (QuoridorRepresentation): the state representation
+        mcts_kwargs (dict): the additional arguments of the MCTS of the process
+        command_queue: the queue of the (pickled) search commands
+        result_queue: the queue the root visit counts are sent to
+    """
+    # The processes already run in parallel
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    environment = QuoridorEnv(game_config)
+    mcts = MCTS(game_config, model, state_representation, **mcts_kwargs)
+    while True:
+        command = command_queue.get()
+        if command is None:
+            break
+        state, feature_planes, nb_simulations, limited_time, intermediate_reward, root_noise = pickle.loads(
+            command)
+        mcts.set_root(state, root_noise)
+        mcts.play_policy(environment,
+                         state,
+                         feature_planes,
+                         nb_simulations=nb_simulations,
+                         limited_time=limited_time,
+                         intermediate_reward=intermediate_reward)
+        result_queue.put(mcts.root_visits(state))
@@ -1,10 +1,13 @@
 import os
 import pickle
+import queue
 import numpy as np
+import torch
+import torch.multiprocessing as mp
 import pygame as pg
 
 from environment import QuoridorState, QuoridorConfig, QuoridorEnv
-from alphazero import MCTS, QuoridorRepresentation, QuoridorModel
+from alphazero import MCTS, QuoridorRepresentation, QuoridorModel, EvaluationCache, InferenceServer
 
 from interactive import INNER_CELL_SIZE, EMPTY_CELL_COLOR, PAWN_0_COLOR, PAWN_1_COLOR, SIZE, WALL_THICKNESS, FPS, WALL_COLOR
 from interactive import draw_gui, draw_board, draw_state, init_surfaces
@@ -14,14 +17,21 @@ class SelfPlayConfig:
     def __init__(self,
                  nb_games=25000,
                  nb_simulations=200,
-                 max_workers=4,
+                 max_workers=1,
                  initial_temperature=1.0,
                  tempered_steps=20,
                  limited_time=None,
                  str_history=False,
                  verbose=False,
                  display_mode=False,
-                 intermediate_reward=False) -> None:
+                 intermediate_reward=False,
+                 nb_parallel_leaves=1,
+                 evaluation_cache_mb=256,
+                 inference_batch_size=0,
+                 inference_max_wait_us=500,
+                 nb_lockstep_games=1,
+                 max_tree_nodes=None,
+                 max_tree_mb=None) -> None:
         self.nb_games = nb_games
         self.nb_simulations = nb_simulations
         self.max_workers = max_workers
@@ -32,9 +42,38 @@ class SelfPlayConfig:
         self.verbose = verbose
         self.display_mode = display_mode
         self.intermediate_reward = intermediate_reward
+        self.nb_parallel_leaves = nb_parallel_leaves
+        self.evaluation_cache_mb = evaluation_cache_mb
+        # Parallel workers send their evaluations to a shared inference server when inference_batch_size > 0
+        self.inference_batch_size = inference_batch_size
+        self.inference_max_wait_us = inference_max_wait_us
+        # Number of games advanced together by a single process (see SelfPlayer.play_games_lockstep)
+        self.nb_lockstep_games = nb_lockstep_games
+        # Budget of the MCTS tree of each game (None for no limit)
+        self.max_tree_nodes = max_tree_nodes
+        self.max_tree_mb = max_tree_mb
 
     def description(self) -> str:
-        return f"SelfPlayConfig: nb_games={self.nb_games}; nb_simulations(MCTS):{self.nb_simulations}; max_workers(NOT WORKING)={self.max_workers}; inital_temperature={self.initial_temperature}; tempered_steps={self.tempered_steps}; limited_time={self.limited_time}; intermediate_reward={self.intermediate_reward}"
+        return f"SelfPlayConfig: nb_games={self.nb_games}; nb_simulations(MCTS):{self.nb_simulations}; max_workers={self.max_workers}; inital_temperature={self.initial_temperature}; tempered_steps={self.tempered_steps}; limited_time={self.limited_time}; intermediate_reward={self.intermediate_reward}; nb_parallel_leaves={self.nb_parallel_leaves}; evaluation_cache_mb={self.evaluation_cache_mb}; inference_batch_size={self.inference_batch_size}; inference_max_wait_us={self.inference_max_wait_us}; nb_lockstep_games={self.nb_lockstep_games}; max_tree_nodes={self.max_tree_nodes}; max_tree_mb={self.max_tree_mb}"
+
+
+class LockstepGame:
+    # Game advanced along with other games by SelfPlayer.play_games_lockstep
+    def __init__(self, game_idx, state: QuoridorState, mcts: MCTS) -> None:
+        self.game_idx = game_idx
+        self.state = state
+        self.mcts = mcts
+        self.feature_planes = []
+        self.history = []
+        # History walked by the search of the current move (None between moves)
+        self.search_history = None
+        self.nb_performed_simulations = 0
+
+    def start_move(self, representation: QuoridorRepresentation):
+        self.mcts.set_root(self.state, root_noise=True)
+        self.search_history = representation.create_history(
+            self.feature_planes[-representation.time_consistency:])
+        self.nb_performed_simulations = 0
 
 
 class SelfPlayer:
@@ -57,6 +96,11 @@ class SelfPlayer:
         self.state_buffer = []
         self.str_history = []
 
+        # Model evaluations shared by all the games played by this self-player (disabled with a null memory cap)
+        self.evaluation_cache = EvaluationCache(
+            game_config.nb_actions, selfplay_config.evaluation_cache_mb
+        ) if selfplay_config.evaluation_cache_mb > 0 else None
+
         if self.selfplay_config.display_mode:
             pg.init()
 
@@ -86,9 +130,18 @@ class SelfPlayer:
         print("###################################")
         # Don't forget to put model in evaluation mode
         self.model.eval()
-        # TODO: use multithreading to play games
-        for i in range(self.nb_games):
-            self.play_game(i)
+        # NOTE: games are only displayed when played by the main process
+        if self.max_workers > 1 and not self.selfplay_config.display_mode:
+            self.play_games_parallel()
+        # NOTE: lockstep games evaluate their leaves by batches which is not supported with intermediate rewards
+        elif self.selfplay_config.nb_lockstep_games > 1 and not self.selfplay_config.intermediate_reward:
+            self.play_games_lockstep()
+        else:
+            for i in range(self.nb_games):
+                self.play_game(i)
+
+            if self.evaluation_cache is not None:
+                print(self.evaluation_cache.description())
 
         if self.selfplay_config.display_mode:
             pg.quit()
@@ -97,19 +150,165 @@ class SelfPlayer:
             self.save_str_history()
         return self.save_buffer()
 
+    def play_games_parallel(self):
+        # Plays the games with max_workers processes (see selfplay_worker) and gathers their records as they finish
+        nb_workers = min(self.max_workers, self.nb_games)
+        print(f"SelfPlayer: playing games with {nb_workers} workers")
+
+        # The workers read the weights of the model from shared memory
+        self.model.share_memory()
+        context = mp.get_context("spawn")
+
+        # Optionally, a single process owns the model and evaluates the leaves of all the workers by batches
+        inference_server = None
+        if self.selfplay_config.inference_batch_size > 0:
+            inference_server = InferenceServer(
+                self.model,
+                self.game_config,
+                self.representation,
+                nb_workers,
+                self.selfplay_config.nb_parallel_leaves,
+                max_batch_size=self.selfplay_config.inference_batch_size,
+                max_wait_us=self.selfplay_config.inference_max_wait_us)
+            print(inference_server.description())
+            inference_server.start(context)
+
+        game_queue = context.Queue()
+        record_queue = context.Queue()
+        for i in range(self.nb_games):
+            game_queue.put(i)
+        for _ in range(nb_workers):
+            game_queue.put(None)
+
+        workers = [
+            context.Process(
+                target=selfplay_worker,
+                args=(self.model if inference_server is None else
+                      inference_server.get_client(worker_idx),
+                      self.game_config, self.representation,
+                      self.selfplay_config, game_queue, record_queue))
+            for worker_idx in range(nb_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        # Each worker sends None once it has no more games to play
+        nb_finished_workers = 0
+        while nb_finished_workers < nb_workers:
+            try:
+                record = record_queue.get(timeout=1.0)
+            except queue.Empty:
+                # NOTE: the workers would wait forever for their evaluations if the inference server stopped (it only stops once they are done)
+                server_failed = inference_server is not None and inference_server.process.exitcode is not None
+                if server_failed or any(worker.exitcode not in (None, 0)
+                                        for worker in workers):
+                    for worker in workers:
+                        worker.terminate()
+                    if inference_server is not None:
+                        inference_server.process.terminate()
+                    raise RuntimeError(
+                        "SelfPlayer: the inference server failed"
+                        if server_failed else "SelfPlayer: a worker failed")
+                continue
+            if record is None:
+                nb_finished_workers += 1
+                continue
+            state_buffer, str_history = pickle.loads(record)
+            self.state_buffer += state_buffer
+            self.str_history += str_history
+
+        for worker in workers:
+            worker.join()
+        if inference_server is not None:
+            inference_server.stop()
+
+    def play_games_lockstep(self):
+        # Advances nb_lockstep_games games at once: the leaves collected by all their searches are evaluated in a single forward pass
+        # NOTE: the searches are not time limited
+        nb_lockstep_games = self.selfplay_config.nb_lockstep_games
+        nb_parallel_leaves = self.selfplay_config.nb_parallel_leaves
+        games = []
+        next_game_idx = 0
+        while next_game_idx < self.nb_games or len(games) > 0:
+            # Start new games in the free slots
+            while len(games) < nb_lockstep_games and next_game_idx < self.nb_games:
+                print(f"Selfplayer: playing game {next_game_idx}")
+                games.append(
+                    LockstepGame(next_game_idx,
+                                 QuoridorState(self.game_config),
+                                 self.create_mcts()))
+                next_game_idx += 1
+
+            # Collect the leaves of all the games
+            collected_leaves = []
+            batch_keys = []
+            batch_planes = []
+            for game in games:
+                if game.search_history is None:
+                    game.start_move(self.representation)
+                leaves, keys, planes, nb_descents = game.mcts.collect_leaves(
+                    self.environment, game.state, game.search_history,
+                    min(nb_parallel_leaves,
+                        self.nb_simulations - game.nb_performed_simulations))
+                game.nb_performed_simulations += nb_descents
+                collected_leaves.append((leaves, len(batch_keys)))
+                batch_keys += keys
+                batch_planes += planes
+
+            # EXPAND all the leaves at once (the searches share the model and the evaluation cache)
+            p, v = None, None
+            if len(batch_planes) > 0:
+                p, v = games[0].mcts.evaluate(batch_keys, batch_planes)
+            for game, (leaves, offset) in zip(games, collected_leaves):
+                game.mcts.expand_leaves(
+                    leaves, None if p is None else p[offset:],
+                    None if v is None else v[offset:])
+                game.mcts.tree.enforce_budget(game.state.key)
+
+            # Play the moves whose searches are over
+            for game in games:
+                if game.nb_performed_simulations < self.nb_simulations:
+                    continue
+                policy = game.mcts.root_policy(game.state,
+                                               self.get_temperature(game.state))
+                action = game.mcts.sample_action(self.environment, game.state,
+                                                 policy)
+                game.state = self.play_action(game.state, game.feature_planes,
+                                              game.history, action, policy)
+                game.search_history = None
+                if game.state.done:
+                    self.add_game_records(game.game_idx, game.state,
+                                          game.history)
+            games = [game for game in games if not game.state.done]
+
+        if self.evaluation_cache is not None:
+            print(self.evaluation_cache.description())
+
+    def create_mcts(self) -> MCTS:
+        return MCTS(self.game_config,
+                    self.model,
+                    self.representation,
+                    nb_parallel_leaves=self.selfplay_config.nb_parallel_leaves,
+                    evaluation_cache=self.evaluation_cache,
+                    max_tree_nodes=self.selfplay_config.max_tree_nodes,
+                    max_tree_mb=self.selfplay_config.max_tree_mb)
+
+    def get_temperature(self, state: QuoridorState) -> float:
+        return self.selfplay_config.initial_temperature if state.t < self.selfplay_config.tempered_steps else 0.0
+
     def play_game(self, game_idx):
         print(f"Selfplayer: playing game {game_idx}")
 
         # Initialize a game and MCTS
         state = QuoridorState(self.game_config)
-        mcts = MCTS(self.game_config, self.model, self.representation)
+        mcts = self.create_mcts()
         feature_planes = []
         history = []
 
         # Play the game
         while not state.done:
             # Take action following MCTS
-            temperature = self.selfplay_config.initial_temperature if state.t < self.selfplay_config.tempered_steps else 0.0
+            temperature = self.get_temperature(state)
             # print(
             #     f"Self-player: searching state {state.to_string(add_nb_walls=True, add_current_player=True)} with temperate {temperature}"
             # )
@@ -120,39 +319,63 @@ class SelfPlayer:
                 nb_simulations=self.nb_simulations,
                 temperature=temperature,
                 limited_time=self.selfplay_config.limited_time,
-                intermediate_reward=self.selfplay_config.intermediate_reward)
-
-            # Compute state planes
-            current_feature_planes = self.representation.generate_instant_planes(
-                state)
-            feature_planes.append(current_feature_planes)
-            current_state_planes = self.representation.generate_state_planes(
-                state, feature_planes)
-
-            history.append(
-                (state.current_player, current_state_planes, policy))
-
-            self.str_history.append(state.to_string())
-
-            # Follow the selected action
-            state = self.environment.step_from_index(state, action_idx=action)
-            if self.selfplay_config.verbose:
-                print(
-                    f"Selfplayer: reached state {state.to_string(add_nb_walls=True, add_current_player=True)}, terminal state: {state.done}"
-                )
-                print(
-                    f"After this step, intermediate reward is {self.environment.get_intermediate_reward(state, self.environment.get_opponent(state.current_player))}"
-                )
-
-            if self.selfplay_config.display_mode:
-                self.screen.blit(self.background, (0, 0))
-                draw_board(self.screen, self.game_config, self.cell)
-                draw_state(self.screen, self.game_config, state, self.pawn_0,
-                           self.pawn_1, self.horizontal_wall,
-                           self.vertical_wall, False)
-                draw_gui(self.screen, self.game_config, state, 0, state.done)
-                pg.display.flip()
+                intermediate_reward=self.selfplay_config.intermediate_reward,
+                root_noise=True)
+            state = self.play_action(state, feature_planes, history, action,
+                                     policy)
+
+        self.add_game_records(game_idx, state, history)
+        if self.selfplay_config.verbose:
+            print(mcts.tree.description())
+
+    def play_action(self, state: QuoridorState, feature_planes, history,
+                    action: int, policy) -> QuoridorState:
+        """Records the searched state of a game and follows the selected action
+
+        Args:
+            state (QuoridorState): the current state of the game
+            feature_planes: the instant planes of the previous states (updated)
+            history: the (player, state planes, policy) records of the game (updated)
+            action (int): the index of the selected action
+            policy: the policy given by MCTS
+
+        Returns:
+            QuoridorState: the next state
+        """
+        # Compute state planes
+        current_feature_planes = self.representation.generate_instant_planes(
+            state)
+        feature_planes.append(current_feature_planes)
+        current_state_planes = self.representation.generate_state_planes(
+            state, feature_planes)
+
+        history.append(
+            (state.current_player, current_state_planes, policy))
+
+        self.str_history.append(state.to_string())
+
+        # Follow the selected action
+        state = self.environment.step_from_index(state, action_idx=action)
+        if self.selfplay_config.verbose:
+            print(
+                f"Selfplayer: reached state {state.to_string(add_nb_walls=True, add_current_player=True)}, terminal state: {state.done}"
+            )
+            print(
+                f"After this step, intermediate reward is {self.environment.get_intermediate_reward(state, self.environment.get_opponent(state.current_player))}"
+            )
+
+        if self.selfplay_config.display_mode:
+            self.screen.blit(self.background, (0, 0))
+            draw_board(self.screen, self.game_config, self.cell)
+            draw_state(self.screen, self.game_config, state, self.pawn_0,
+                       self.pawn_1, self.horizontal_wall,
+                       self.vertical_wall, False)
+            draw_gui(self.screen, self.game_config, state, 0, state.done)
+            pg.display.flip()
+
+        return state
 
+    def add_game_records(self, game_idx, state: QuoridorState, history):
         # Add the game reward and create a state buffer
 
         # Draw
@@ -191,3 +414,37 @@ class SelfPlayer:
         with open(full_path, 'w') as handle:
             for state_str in self.str_history:
                 handle.write(f"{state_str}\n")
+
+
+def selfplay_worker(model, game_config: QuoridorConfig,
+                    representation: QuoridorRepresentation,
+                    selfplay_config: SelfPlayConfig, game_queue,
+                    record_queue):
+    """Plays the games whose indices are read from game_queue (until reading None) and sends their records to record_queue
+
+    Args:
+        model: the model (whose weights are in shared memory) or the InferenceClient evaluating the leaves
+        game_config (QuoridorConfig): the game config
+        representation (QuoridorRepresentation): the state representation
+        selfplay_config (SelfPlayConfig): the self-play config
+        game_queue: the queue of the indices of the games to play
+        record_queue: the queue the (pickled) records of each game are sent to
+    """
+    # The workers already run in parallel
+    torch.set_num_threads(1)
+    self_player = SelfPlayer(model, game_config, QuoridorEnv(game_config),
+                             representation, None, selfplay_config)
+    while True:
+        game_idx = game_queue.get()
+        if game_idx is None:
+            break
+        self_player.clear()
+        self_player.play_game(game_idx)
+        # NOTE: records are pickled so that their tensors are not sent through shared memory (one file descriptor each)
+        record_queue.put(
+            pickle.dumps((self_player.state_buffer, self_player.str_history),
+                         protocol=pickle.HIGHEST_PROTOCOL))
+
+    if self_player.evaluation_cache is not None:
+        print(self_player.evaluation_cache.description())
+    record_queue.put(None)
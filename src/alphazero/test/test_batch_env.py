@@ -0,0 +1,55 @@
+import sys
+import os
+
+# Required to properly append path (this sets the root folder to /src)
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import numpy as np
+
+from environment import QuoridorEnv, QuoridorState, QuoridorConfig, BatchQuoridorEnv
+from alphazero import QuoridorRepresentation
+
+if __name__ == "__main__":
+
+    # Plays random games with BatchQuoridorEnv and QuoridorEnv side by side and checks that they agree
+    nb_games = 32
+    game_config = QuoridorConfig(grid_size=5, max_walls=5, max_t=60)
+    environment = QuoridorEnv(game_config)
+    representation = QuoridorRepresentation(game_config)
+    batch_environment = BatchQuoridorEnv(
+        game_config,
+        nb_games,
+        time_consistency=representation.time_consistency)
+    rng = np.random.default_rng(0)
+
+    states = [QuoridorState(game_config) for _ in range(nb_games)]
+    feature_planes = [[representation.generate_instant_planes(state)]
+                      for state in states]
+    while not all(state.done for state in states):
+        batch_mask = batch_environment.legal_action_mask()
+        batch_observations = batch_environment.observe()
+        action_indices = np.zeros(nb_games, dtype=np.int64)
+        for game_idx, state in enumerate(states):
+            if state.done:
+                assert not batch_mask[game_idx].any()
+                continue
+            mask = environment.legal_action_mask(state)
+            assert (batch_mask[game_idx] == mask).all(), (game_idx, state.t)
+            state_planes = representation.generate_state_planes(
+                state, feature_planes[game_idx]).numpy()
+            assert np.allclose(batch_observations[game_idx],
+                               state_planes), (game_idx, state.t)
+            action_indices[game_idx] = rng.choice(np.flatnonzero(mask))
+
+        batch_done, batch_winner = batch_environment.step(action_indices)
+        for game_idx, state in enumerate(states):
+            if state.done:
+                continue
+            environment.step_from_index(state, int(action_indices[game_idx]))
+            feature_planes[game_idx].append(
+                representation.generate_instant_planes(state))
+            assert batch_done[game_idx] == state.done, (game_idx, state.t)
+            assert batch_winner[game_idx] == state.winner, (game_idx, state.t)
+
+    print(f"{nb_games} random games: BatchQuoridorEnv matches QuoridorEnv")
@@ -0,0 +1,55 @@
+import sys
+import os
+
+# Required to properly append path (this sets the root folder to /src)
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import numpy as np
+
+from environment import QuoridorEnv, QuoridorState, QuoridorConfig
+
+
+def snapshot(state: QuoridorState):
+    # Everything push and pop update (connected components are compared through their roots since pops keep path compressions)
+    return (state.key, state.walls.tobytes(), tuple(state.player_positions),
+            tuple(state.nb_walls), state.current_player, state.t, state.done,
+            state.winner, state.wall_mask, state.legal_walls,
+            [state.ufind.find(i) for i in range(state.ufind.nb_elements)])
+
+
+if __name__ == "__main__":
+
+    # Walks random action sequences with push and checks that pop restores every state along the way
+    game_config = QuoridorConfig(grid_size=9, max_walls=10, max_t=100)
+    environment = QuoridorEnv(game_config)
+    rng = np.random.default_rng(0)
+    max_depth = 6
+
+    for game_idx in range(5):
+        state = QuoridorState(game_config)
+        while not state.done:
+            legal_actions = np.flatnonzero(
+                environment.legal_action_mask(state))
+            for _ in range(3):
+                snapshots = []
+                for _ in range(max_depth):
+                    if state.done:
+                        break
+                    mask = environment.legal_action_mask(state)
+                    snapshots.append(snapshot(state))
+                    action_idx = int(rng.choice(np.flatnonzero(mask)))
+                    # A pushed action leads to the same state as a stepped one
+                    stepped_state = state.copy()
+                    environment.step_from_index(stepped_state, action_idx)
+                    environment.push_from_index(state, action_idx)
+                    assert snapshot(state)[:-2] == snapshot(
+                        stepped_state)[:-2], (game_idx, state.t)
+                while snapshots:
+                    environment.pop(state)
+                    assert snapshot(state) == snapshots.pop(), (game_idx,
+                                                                state.t)
+            environment.step_from_index(state,
+                                        int(rng.choice(legal_actions)))
+
+    print("push/pop restored every state")
@@ -0,0 +1,43 @@
+import sys
+import os
+
+# Required to properly append path (this sets the root folder to /src)
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import numpy as np
+
+from utils import UFindCC
+
+if __name__ == "__main__":
+
+    # Adds random walls and checks that rolling back to a checkpoint restores the exact union-find arrays
+    rng = np.random.default_rng(0)
+    for grid_size in (5, 9):
+        for _ in range(300):
+            ufind = UFindCC(grid_size)
+            checkpoints = []
+            for _ in range(20):
+                checkpoints.append((ufind.checkpoint(), ufind.copy()))
+                direction = int(rng.integers(2))
+                position = (int(rng.integers(grid_size - 1)),
+                            int(rng.integers(grid_size - 1)))
+                ufind.add_wall(position, direction)
+
+            # Revert a random number of walls at once, then the remaining ones one by one
+            nb_reverted = int(rng.integers(1, len(checkpoints) + 1))
+            checkpoints = checkpoints[:len(checkpoints) - nb_reverted + 1]
+            while checkpoints:
+                mark, expected_ufind = checkpoints.pop()
+                ufind.rollback(mark)
+                assert list(ufind.parents) == list(expected_ufind.parents)
+                assert list(ufind.ranks) == list(expected_ufind.ranks)
+                for check_direction in range(2):
+                    for i in range(grid_size - 1):
+                        for j in range(grid_size - 1):
+                            assert ufind.check_wall(
+                                (i, j), check_direction
+                            ) == expected_ufind.check_wall(
+                                (i, j), check_direction)
+
+    print("UFindCC rollbacks restored every checkpoint")
@@ -0,0 +1,57 @@
+import time
+
+from environment import QuoridorState, QuoridorEnv, QuoridorConfig
+
+
+class TimeManager:
+    """Allocates the search time of each move of a player from its total game clock
+
+    The remaining time is split over an estimate of the remaining moves of the player (the length
+    of its shortest path plus its remaining walls). The budget is increased in the midgame, i.e.
+    once walls have been placed while the player can still place some, where searches matter most.
+    """
+
+    def __init__(self,
+                 game_config: QuoridorConfig,
+                 total_time: float,
+                 midgame_factor: float = 1.5,
+                 min_move_time: float = 0.05) -> None:
+        self.max_walls = game_config.max_walls
+        self.total_time = total_time
+        self.midgame_factor = midgame_factor
+        self.min_move_time = min_move_time
+        self.remaining_time = total_time
+        self.move_start_time = None
+
+    def start_move(self, environment: QuoridorEnv,
+                   state: QuoridorState) -> float:
+        """Starts the clock of a move and returns its time budget
+
+        Args:
+            environment (QuoridorEnv): the game environment
+            state (QuoridorState): the state to search
+
+        Returns:
+            float: the time (in seconds) allocated to the search
+        """
+        player_idx = state.current_player
+        distance = environment.pathfinder.find_shortest(
+            state.walls, state.player_positions[player_idx],
+            environment.x_targets[player_idx])
+        nb_remaining_walls = self.max_walls - state.nb_walls[player_idx]
+        nb_remaining_moves = max(distance + nb_remaining_walls, 1)
+
+        budget = self.remaining_time / nb_remaining_moves
+        if sum(state.nb_walls) > 0 and nb_remaining_walls > 0:
+            budget *= self.midgame_factor
+
+        self.move_start_time = time.time()
+        return max(min(budget, self.remaining_time), self.min_move_time)
+
+    def end_move(self):
+        # Charges the time spent since start_move to the clock
+        self.remaining_time = max(
+            self.remaining_time - (time.time() - self.move_start_time), 0.0)
+
+    def description(self) -> str:
+        return f"TimeManager: total_time={self.total_time}; remaining_time={self.remaining_time:.2f}; midgame_factor={self.midgame_factor}; min_move_time={self.min_move_time}"
@@ -0,0 +1 @@
+from .benchmarks import measure, generate_positions, perft
@@ -0,0 +1,202 @@
+import sys
+import os
+
+# Required to properly append path (this sets the root folder to /src)
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import platform
+import subprocess
+from argparse import ArgumentParser
+from datetime import datetime
+
+from environment import QuoridorEnv, QuoridorConfig
+from benchmark.benchmarks import generate_positions, bench_possible_actions, bench_perft, bench_pathfinder, bench_minimax, bench_rollouts, bench_mcts, bench_selfplay
+
+BENCHMARKS = [
+    "possible_actions", "perft", "pathfinder", "minimax", "rollout", "mcts",
+    "selfplay"
+]
+
+# Number of walls per player used for each grid size (defaults to the grid size)
+MAX_WALLS = {5: 5, 7: 7, 9: 10}
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        description=
+        'Measures the search throughput (python -m benchmark from src)')
+    parser.add_argument('--grid_sizes',
+                        type=int,
+                        nargs='+',
+                        default=[5, 7, 9],
+                        help='sizes of the grids to benchmark')
+    parser.add_argument('--benchmarks',
+                        type=str,
+                        nargs='+',
+                        choices=BENCHMARKS,
+                        default=BENCHMARKS,
+                        help='benchmarks to run')
+    parser.add_argument('--max_t',
+                        type=int,
+                        default=100,
+                        help='maximum number of time steps in a game')
+    parser.add_argument('--min_time',
+                        type=float,
+                        default=1.0,
+                        help='minimum duration (in seconds) of each measure')
+    parser.add_argument('--nb_positions',
+                        type=int,
+                        default=8,
+                        help='number of fixed positions used by benchmarks')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='seed used to generate the fixed positions')
+    parser.add_argument('--perft_depth',
+                        type=int,
+                        default=2,
+                        help='depth of the perft node count')
+    parser.add_argument('--minimax_plies',
+                        type=int,
+                        default=1,
+                        choices=[1, 2],
+                        help='number of plies searched by minimax')
+    parser.add_argument('--nb_simulations',
+                        type=int,
+                        default=50,
+                        help='number of MCTS simulations per search')
+    parser.add_argument('--nb_parallel_leaves',
+                        type=int,
+                        default=1,
+                        help='number of leaves evaluated at once by MCTS')
+    parser.add_argument('--nb_selfplay_games',
+                        type=int,
+                        default=1,
+                        help='number of self-play games to time')
+    parser.add_argument('--selfplay_simulations',
+                        type=int,
+                        default=10,
+                        help='number of MCTS simulations per self-play move')
+    parser.add_argument('--time_consistency',
+                        type=int,
+                        default=8,
+                        help='number of previous states in the representation')
+    parser.add_argument('--nb_filters',
+                        type=int,
+                        default=64,
+                        help='number of filters of the real model')
+    parser.add_argument('--nb_residual_blocks',
+                        type=int,
+                        default=9,
+                        help='number of residual blocks of the real model')
+    parser.add_argument('--output',
+                        type=str,
+                        default=None,
+                        help='path of the JSON file to write (stdout if none)')
+    return parser
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_grid_size(args, grid_size: int) -> dict:
+    game_config = QuoridorConfig(grid_size=grid_size,
+                                 max_walls=MAX_WALLS.get(grid_size, grid_size),
+                                 max_t=args.max_t)
+    environment = QuoridorEnv(game_config)
+    positions = generate_positions(environment,
+                                   game_config,
+                                   args.nb_positions,
+                                   seed=args.seed)
+    results = {}
+
+    def log(name):
+        print(f"Benchmark: grid_size={grid_size}; {name}={results[name]}",
+              file=sys.stderr)
+
+    if "possible_actions" in args.benchmarks:
+        results["possible_actions"] = bench_possible_actions(
+            environment, positions, args.min_time)
+        log("possible_actions")
+    if "perft" in args.benchmarks:
+        results["perft"] = bench_perft(environment, game_config,
+                                       args.perft_depth)
+        log("perft")
+    if "pathfinder" in args.benchmarks:
+        results["pathfinder"] = bench_pathfinder(environment, positions,
+                                                 args.min_time)
+        log("pathfinder")
+    if "minimax" in args.benchmarks:
+        results["minimax"] = bench_minimax(environment, positions,
+                                           args.minimax_plies, args.min_time)
+        log("minimax")
+    if "rollout" in args.benchmarks:
+        results["rollout"] = bench_rollouts(environment, positions,
+                                            args.min_time)
+        log("rollout")
+
+    if "mcts" in args.benchmarks or "selfplay" in args.benchmarks:
+        # NOTE: torch (and thus alphazero) is only required by these benchmarks
+        import torch
+        from alphazero import QuoridorRepresentation, QuoridorModel, ModelConfig
+        from benchmark.uniform_model import UniformModel
+
+        device = torch.device("cpu")
+        representation = QuoridorRepresentation(
+            game_config, time_consistency=args.time_consistency)
+        models = {
+            "uniform":
+            UniformModel(device, game_config),
+            "real":
+            QuoridorModel(
+                device, game_config, representation,
+                ModelConfig(nb_residual_blocks=args.nb_residual_blocks,
+                            nb_filters=args.nb_filters)).to(device).eval()
+        }
+        if "mcts" in args.benchmarks:
+            for model_name, model in models.items():
+                results[f"mcts_{model_name}"] = bench_mcts(
+                    environment, game_config, positions, model,
+                    representation, args.nb_simulations,
+                    args.nb_parallel_leaves, args.min_time)
+                log(f"mcts_{model_name}")
+        if "selfplay" in args.benchmarks:
+            results["selfplay"] = bench_selfplay(environment, game_config,
+                                                 models["real"],
+                                                 representation,
+                                                 args.selfplay_simulations,
+                                                 args.nb_selfplay_games)
+            log("selfplay")
+
+    return results
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+
+    report = {
+        "commit": get_commit(),
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": {
+            str(grid_size): run_grid_size(args, grid_size)
+            for grid_size in args.grid_sizes
+        }
+    }
+
+    report_str = json.dumps(report, indent=2)
+    if args.output is None:
+        print(report_str)
+    else:
+        with open(args.output, "w") as handle:
+            handle.write(report_str)
@@ -0,0 +1,233 @@
+import importlib.util
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+import numpy as np
+
+from environment import QuoridorState, QuoridorEnv, QuoridorConfig
+from utils import PathFinder
+
+
+def measure(run_once, min_time: float):
+    """Repeatedly calls run_once until min_time seconds have elapsed
+
+    Args:
+        run_once (callable): function performing some work and returning the number of operations it did
+        min_time (float): minimum duration of the measure (in seconds)
+
+    Returns:
+        tuple[int, float]: the number of operations and the elapsed time
+    """
+    nb_operations = 0
+    start_time = time.perf_counter()
+    while True:
+        nb_operations += run_once()
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= min_time:
+            return nb_operations, elapsed
+
+
+def generate_positions(environment: QuoridorEnv,
+                       game_config: QuoridorConfig,
+                       nb_positions: int,
+                       seed: int = 0):
+    """Generates fixed (i.e. seeded) positions by playing random legal actions
+
+    Args:
+        environment (QuoridorEnv): the game environment
+        game_config (QuoridorConfig): the game configuration
+        nb_positions (int): the number of positions
+        seed (int, optional): the random seed. Defaults to 0.
+
+    Returns:
+        list[QuoridorState]: the generated positions (none of them is over)
+    """
+    rng = np.random.default_rng(seed)
+    positions = []
+    while len(positions) < nb_positions:
+        state = QuoridorState(game_config)
+        nb_steps = rng.integers(0, game_config.grid_size * 3)
+        for _ in range(nb_steps):
+            legal_actions = np.flatnonzero(
+                environment.legal_action_mask(state))
+            environment.step_from_index(state,
+                                        int(rng.choice(legal_actions)))
+            if state.done:
+                break
+        if not state.done:
+            state.undo_records = []
+            positions.append(state)
+    return positions
+
+
+def perft(environment: QuoridorEnv, state: QuoridorState, depth: int) -> int:
+    # Counts the leaf nodes of the game tree (walked with push/pop)
+    if depth == 0 or state.done:
+        return 1
+    actions = environment.get_possible_actions(state)
+    if depth == 1:
+        return len(actions)
+    nb_nodes = 0
+    for action in actions:
+        environment.push(state, action)
+        nb_nodes += perft(environment, state, depth - 1)
+        environment.pop(state)
+    return nb_nodes
+
+
+def bench_possible_actions(environment: QuoridorEnv, positions,
+                           min_time: float) -> dict:
+    results = {}
+    for cached in (False, True):
+
+        def run_once():
+            for state in positions:
+                # Drop the cached legal walls so that every call generates them
+                state.legal_walls = None
+                # The distance maps would otherwise all be cache hits after the first pass on these fixed positions
+                if not cached:
+                    environment.pathfinder.distance_cache.clear()
+                environment.get_possible_actions(state)
+            return len(positions)
+
+        nb_calls, elapsed = measure(run_once, min_time)
+        results["cached_calls_per_sec" if cached else
+                "calls_per_sec"] = nb_calls / elapsed
+    return results
+
+
+def bench_perft(environment: QuoridorEnv, game_config: QuoridorConfig,
+                depth: int) -> dict:
+    state = QuoridorState(game_config)
+    start_time = time.perf_counter()
+    nb_nodes = perft(environment, state, depth)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "depth": depth,
+        "nodes": nb_nodes,
+        "nodes_per_sec": nb_nodes / elapsed
+    }
+
+
+def bench_pathfinder(environment: QuoridorEnv, positions,
+                     min_time: float) -> dict:
+    pathfinder = PathFinder(environment.grid_size)
+    results = {}
+    for cached in (False, True):
+
+        def run_once():
+            for state in positions:
+                if not cached:
+                    pathfinder.distance_cache.clear()
+                for player_idx in range(2):
+                    pathfinder.find_shortest(
+                        state.walls, state.player_positions[player_idx],
+                        environment.x_targets[player_idx])
+            return 2 * len(positions)
+
+        nb_queries, elapsed = measure(run_once, min_time)
+        results["cached_queries_per_sec" if cached else
+                "queries_per_sec"] = nb_queries / elapsed
+    return results
+
+
+def bench_minimax(environment: QuoridorEnv, positions, plies: int,
+                  min_time: float) -> dict:
+    from minimax.minimax import minimax
+
+    # Count the nodes through push (called once per explored child)
+    nb_pushes = [0]
+    push = environment.push
+
+    def counting_push(state, action):
+        nb_pushes[0] += 1
+        return push(state, action)
+
+    def run_once():
+        nb_pushes[0] = 0
+        for state in positions:
+            # NOTE: minimax evaluates leaves at depth 2
+            minimax(environment, state, 2 - plies, True, None)
+        return nb_pushes[0]
+
+    environment.push = counting_push
+    try:
+        nb_nodes, elapsed = measure(run_once, min_time)
+    finally:
+        del environment.push
+    return {"plies": plies, "nodes_per_sec": nb_nodes / elapsed}
+
+
+def load_mc_rave_tree():
+    # The mc-rave folder is not a valid package name so its tree module is loaded from its path
+    tree_path = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '../mc-rave/tree.py'))
+    spec = importlib.util.spec_from_file_location("mc_rave_tree", tree_path)
+    tree = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tree)
+    return tree
+
+
+def bench_rollouts(environment: QuoridorEnv, positions,
+                   min_time: float) -> dict:
+    tree = load_mc_rave_tree()
+    nodes = [
+        tree.MCTSNode(environment, state, state.current_player)
+        for state in positions
+    ]
+
+    def run_once():
+        for node in nodes:
+            node.rollout()
+        return len(nodes)
+
+    nb_rollouts, elapsed = measure(run_once, min_time)
+    return {"rollouts_per_sec": nb_rollouts / elapsed}
+
+
+def bench_mcts(environment: QuoridorEnv, game_config: QuoridorConfig,
+               positions, model, representation, nb_simulations: int,
+               nb_parallel_leaves: int, min_time: float) -> dict:
+    import torch
+    from alphazero import MCTS
+
+    def run_once():
+        for state in positions:
+            mcts = MCTS(game_config,
+                        model,
+                        representation,
+                        nb_parallel_leaves=nb_parallel_leaves)
+            mcts.play_policy(environment,
+                             state, [],
+                             nb_simulations=nb_simulations)
+        return nb_simulations * len(positions)
+
+    with torch.no_grad():
+        nb_simulations_done, elapsed = measure(run_once, min_time)
+    return {
+        "nb_parallel_leaves": nb_parallel_leaves,
+        "simulations_per_sec": nb_simulations_done / elapsed
+    }
+
+
+def bench_selfplay(environment: QuoridorEnv, game_config: QuoridorConfig,
+                   model, representation, nb_simulations: int,
+                   nb_games: int) -> dict:
+    import torch
+    from alphazero import SelfPlayer, SelfPlayConfig
+
+    selfplay_config = SelfPlayConfig(nb_games=nb_games,
+                                     nb_simulations=nb_simulations)
+    self_player = SelfPlayer(model, game_config, environment, representation,
+                             None, selfplay_config)
+    start_time = time.perf_counter()
+    # NOTE: the self-player logs are sent to stderr to keep stdout for the JSON report
+    with torch.no_grad(), redirect_stdout(sys.stderr):
+        for i in range(nb_games):
+            self_player.play_game(i)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "nb_simulations": nb_simulations,
+        "games_per_hour": nb_games * 3600.0 / elapsed
+    }
@@ -0,0 +1,30 @@
+import torch
+from torch import Tensor
+
+from environment import QuoridorConfig
+
+
+class UniformModel:
+    """Stand-in for QuoridorModel returning uniform priors and null values,
+    used to measure the cost of the search alone (i.e. without network inference)
+    """
+
+    def __init__(self, device, game_config: QuoridorConfig) -> None:
+        self.device = device
+        self.nb_actions = game_config.nb_actions
+
+    def __call__(self, x: Tensor):
+        p = torch.full((x.shape[0], self.nb_actions),
+                       1.0 / self.nb_actions,
+                       device=self.device)
+        v = torch.zeros((x.shape[0], 1), device=self.device)
+        return p, v
+
+    def eval(self):
+        return self
+
+    def description(self) -> str:
+        return "Model: uniform"
+
+    def to_string(self, uuid_based=False):
+        return "uniform"
@@ -1,4 +1,6 @@
 from .quoridor_config import QuoridorConfig
 from .quoridor_state import QuoridorState
+from .quoridor_bitboard_state import BitboardQuoridorState, BitboardWalls
 from .quoridor_action import MoveAction, WallAction, QuoridorAction
-from .quoridor_env import QuoridorEnv, DIRECT_OFFSETS, INDIRECT_OFFSETS
\ No newline at end of file
+from .quoridor_env import QuoridorEnv, DIRECT_OFFSETS, INDIRECT_OFFSETS
+from .quoridor_batch_env import BatchQuoridorEnv
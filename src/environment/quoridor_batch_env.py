@@ -0,0 +1,370 @@
+import numpy as np
+from environment import QuoridorConfig, DIRECT_OFFSETS, INDIRECT_OFFSETS
+
+
+class BatchQuoridorEnv:
+    """Plays N Quoridor games at once with stacked NumPy arrays
+
+    The rules are the ones of QuoridorEnv (including its move tables) but every
+    operation (stepping, legal action masks and observations) is applied to all the
+    games at the same time. Actions are given with their absolute indices
+    (i.e. as in QuoridorEnv.step_from_index, not from the current player perspective).
+    Finished games are left untouched by step until they are reset.
+    """
+
+    def __init__(self,
+                 game_config: QuoridorConfig,
+                 nb_games: int,
+                 time_consistency: int = 8) -> None:
+        """Initializes N Quoridor games
+
+        Args:
+            game_config (QuoridorConfig): the game configuration
+            nb_games (int): the number of simultaneous games
+            time_consistency (int, optional): number of past states in the observations (see QuoridorRepresentation). Defaults to 8.
+        """
+        self.grid_size = game_config.grid_size
+        self.max_walls = game_config.max_walls
+        self.max_t = game_config.max_t
+        self.nb_actions = game_config.nb_actions
+        self.nb_games = nb_games
+        self.time_consistency = time_consistency
+        # player x_targets
+        self.x_targets = np.array([self.grid_size - 1, 0])
+
+        g = self.grid_size
+        # walls[n, i, j] is -1 for empty, 0 for a wall along x and 1 for a wall along y
+        self.walls = np.full((nb_games, g - 1, g - 1), -1, dtype=np.int8)
+        # player_positions[n, player_idx] = (x, y)
+        self.player_positions = np.zeros((nb_games, 2, 2), dtype=np.int64)
+        # number of already placed walls for each player
+        self.nb_walls = np.zeros((nb_games, 2), dtype=np.int64)
+        self.current_player = np.zeros(nb_games, dtype=np.int64)
+        self.t = np.zeros(nb_games, dtype=np.int64)
+        self.done = np.zeros(nb_games, dtype=bool)
+        self.winner = np.full(nb_games, -1, dtype=np.int64)
+        # Last time_consistency instant planes of each game (oldest first, padded with 0)
+        self.feature_planes = np.zeros((nb_games, time_consistency, 3, g, g),
+                                       dtype=np.float32)
+
+        self.reset()
+
+    def reset(self, game_indices=None):
+        """Resets the provided games (all of them by default) to the initial state
+
+        Args:
+            game_indices (optional): indices (or boolean mask) of the games to reset. Defaults to None.
+        """
+        if game_indices is None:
+            game_indices = np.arange(self.nb_games)
+        self.walls[game_indices] = -1
+        self.player_positions[game_indices] = [(0, self.grid_size // 2),
+                                               (self.grid_size - 1,
+                                                self.grid_size // 2)]
+        self.nb_walls[game_indices] = 0
+        self.current_player[game_indices] = 0
+        self.t[game_indices] = 0
+        self.done[game_indices] = False
+        self.winner[game_indices] = -1
+        self.feature_planes[game_indices] = 0.0
+        self.feature_planes[game_indices,
+                            -1] = self.instant_planes()[game_indices]
+
+    def step(self, action_indices):
+        """Executes one action in every game that is not over
+
+        Args:
+            action_indices: array of N action indices (assumed to be valid, ignored for finished games)
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: done flags and winners (-1 for none) of the games
+        """
+        g = self.grid_size
+        action_indices = np.asarray(action_indices, dtype=np.int64)
+        games = np.arange(self.nb_games)
+        active = ~self.done
+        player_idx = self.current_player
+
+        # Move pawn actions
+        moves = active & (action_indices < g * g)
+        target_x, target_y = np.divmod(action_indices[moves], g)
+        self.player_positions[moves, player_idx[moves], 0] = target_x
+        self.player_positions[moves, player_idx[moves], 1] = target_y
+
+        # Add wall actions
+        walls = active & (action_indices >= g * g)
+        wall_direction, wall_idx = np.divmod(action_indices[walls] - g * g,
+                                             (g - 1) * (g - 1))
+        wall_x, wall_y = np.divmod(wall_idx, g - 1)
+        self.walls[games[walls], wall_x, wall_y] = wall_direction
+        self.nb_walls[walls, player_idx[walls]] += 1
+
+        # Check whether the player won (or whether the game is a draw)
+        player_won = active & (self.player_positions[games, player_idx, 0]
+                               == self.x_targets[player_idx])
+        self.winner[player_won] = player_idx[player_won]
+        self.t[active] += 1
+        self.done |= player_won | (active & (self.t >= self.max_t))
+        self.current_player[active] = 1 - player_idx[active]
+
+        # Update the feature planes
+        self.feature_planes[active, :-1] = self.feature_planes[active, 1:]
+        self.feature_planes[active, -1] = self.instant_planes()[active]
+
+        return self.done.copy(), self.winner.copy()
+
+    def get_blocked_edges(self, walls: np.ndarray):
+        """Returns the edges of the grid cut by walls
+
+        Args:
+            walls (np.ndarray): [K, g-1, g-1] wall arrays
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: [K, g-1, g] blocked moves between (x, y) and (x+1, y) and [K, g, g-1] blocked moves between (x, y) and (x, y+1)
+        """
+        g = self.grid_size
+        blocked_x = np.zeros((walls.shape[0], g - 1, g), dtype=bool)
+        blocked_y = np.zeros((walls.shape[0], g, g - 1), dtype=bool)
+        # Walls along y cut the moves along x (and conversely)
+        blocked_x[:, :, :-1] |= walls == 1
+        blocked_x[:, :, 1:] |= walls == 1
+        blocked_y[:, :-1, :] |= walls == 0
+        blocked_y[:, 1:, :] |= walls == 0
+        return blocked_x, blocked_y
+
+    def check_paths(self, walls: np.ndarray,
+                    player_positions: np.ndarray) -> np.ndarray:
+        """Checks with a vectorized flood fill that both players can reach their goal
+
+        Args:
+            walls (np.ndarray): [K, g-1, g-1] wall arrays
+            player_positions (np.ndarray): [K, 2, 2] player positions
+
+        Returns:
+            np.ndarray: [K] boolean array, True if both players can reach their goal
+        """
+        nb_boards = walls.shape[0]
+        blocked_x, blocked_y = self.get_blocked_edges(walls)
+        # Flood fill from both players at once, i.e. on [K, 2, g, g] arrays
+        free_x = ~blocked_x[:, None]
+        free_y = ~blocked_y[:, None]
+        reached = np.zeros((nb_boards, 2, self.grid_size, self.grid_size),
+                           dtype=bool)
+        boards = np.arange(nb_boards)
+        for player_idx in range(2):
+            reached[boards, player_idx, player_positions[:, player_idx, 0],
+                    player_positions[:, player_idx, 1]] = True
+        while True:
+            expanded = reached.copy()
+            expanded[:, :, 1:, :] |= reached[:, :, :-1, :] & free_x
+            expanded[:, :, :-1, :] |= reached[:, :, 1:, :] & free_x
+            expanded[:, :, :, 1:] |= reached[:, :, :, :-1] & free_y
+            expanded[:, :, :, :-1] |= reached[:, :, :, 1:] & free_y
+            if np.array_equal(expanded, reached):
+                break
+            reached = expanded
+        return reached[:, 0, self.x_targets[0]].any(
+            axis=-1) & reached[:, 1, self.x_targets[1]].any(axis=-1)
+
+    def get_corner_labels(self, horizontal: np.ndarray,
+                          vertical: np.ndarray) -> np.ndarray:
+        """Labels the connected components formed by the walls and the borders
+
+        Args:
+            horizontal (np.ndarray): [N, g-1, g-1] mask of the walls along x
+            vertical (np.ndarray): [N, g-1, g-1] mask of the walls along y
+
+        Returns:
+            np.ndarray: [N, g+1, g+1] labels of the corners of the cells (corners that do not touch any wall have their own label)
+        """
+        g = self.grid_size
+        nb_boards = horizontal.shape[0]
+        # A wall along x at (i, j) goes through the corners (i, j+1), (i+1, j+1) and (i+2, j+1)
+        # joined_x[n, a, b] is True if the corners (a, b) and (a+1, b) are joined
+        joined_x = np.zeros((nb_boards, g, g + 1), dtype=bool)
+        joined_x[:, :-1, 1:-1] |= horizontal
+        joined_x[:, 1:, 1:-1] |= horizontal
+        # Similarly, a wall along y at (i, j) goes through the corners (i+1, j), (i+1, j+1) and (i+1, j+2)
+        joined_y = np.zeros((nb_boards, g + 1, g), dtype=bool)
+        joined_y[:, 1:-1, :-1] |= vertical
+        joined_y[:, 1:-1, 1:] |= vertical
+
+        # Propagate the minimum label, starting with a common label for the border
+        labels = np.broadcast_to(
+            np.arange((g + 1) * (g + 1)).reshape(g + 1, g + 1),
+            (nb_boards, g + 1, g + 1)).copy()
+        labels[:, [0, -1], :] = 0
+        labels[:, :, [0, -1]] = 0
+        while True:
+            new_labels = labels.copy()
+            np.minimum(new_labels[:, 1:],
+                       labels[:, :-1],
+                       out=new_labels[:, 1:],
+                       where=joined_x)
+            np.minimum(new_labels[:, :-1],
+                       labels[:, 1:],
+                       out=new_labels[:, :-1],
+                       where=joined_x)
+            np.minimum(new_labels[:, :, 1:],
+                       labels[:, :, :-1],
+                       out=new_labels[:, :, 1:],
+                       where=joined_y)
+            np.minimum(new_labels[:, :, :-1],
+                       labels[:, :, 1:],
+                       out=new_labels[:, :, :-1],
+                       where=joined_y)
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
+
+    def legal_wall_mask(self) -> np.ndarray:
+        """Returns the mask of the walls that can be placed in every game (regardless of the number of walls left)
+
+        Returns:
+            np.ndarray: [N, 2, g-1, g-1] boolean array indexed by (direction, x, y)
+        """
+        g = self.grid_size
+        horizontal = self.walls == 0
+        vertical = self.walls == 1
+
+        # 1. Free slots: the intersection is empty and there is no wall of the same direction in the axis-aligned adjacent intersections
+        free = np.stack([self.walls == -1, self.walls == -1], axis=1)
+        free[:, 0, 1:, :] &= ~horizontal[:, :-1, :]
+        free[:, 0, :-1, :] &= ~horizontal[:, 1:, :]
+        free[:, 1, :, 1:] &= ~vertical[:, :, :-1]
+        free[:, 1, :, :-1] &= ~vertical[:, :, 1:]
+
+        # 2. A wall can only cut a path if it closes a loop with the borders and the other walls
+        # i.e. if two of its three corners (its ends and its middle) already belong to the same connected component
+        corner_labels = self.get_corner_labels(horizontal, vertical)
+        # wall_labels[n, direction, k, i, j] is the label of the k-th corner of the wall (i, j)
+        wall_labels = np.stack([
+            np.stack([corner_labels[:, k:k + g - 1, 1:-1] for k in range(3)],
+                     axis=1),
+            np.stack([corner_labels[:, 1:-1, k:k + g - 1] for k in range(3)],
+                     axis=1)
+        ],
+                               axis=1)
+        closes_loop = (wall_labels[:, :, 0] == wall_labels[:, :, 1]) | (
+            wall_labels[:, :, 0] == wall_labels[:, :, 2]) | (
+                wall_labels[:, :, 1] == wall_labels[:, :, 2])
+
+        # 3. Check the paths of the remaining candidates all at once
+        candidates = np.argwhere(free & closes_loop
+                                 & ~self.done[:, None, None, None])
+        if len(candidates) > 0:
+            games, directions, wall_x, wall_y = candidates.T
+            candidate_walls = self.walls[games]
+            candidate_walls[np.arange(len(candidates)), wall_x,
+                            wall_y] = directions
+            free[games, directions, wall_x,
+                 wall_y] = self.check_paths(candidate_walls,
+                                            self.player_positions[games])
+        return free
+
+    def legal_move_mask(self) -> np.ndarray:
+        """Returns the mask of the pawn moves the current player can take in every game
+
+        Returns:
+            np.ndarray: [N, g, g] boolean array indexed by target position
+        """
+        g = self.grid_size
+        games = np.arange(self.nb_games)
+        player_pos = self.player_positions[games, self.current_player]
+        opponent_pos = self.player_positions[games, 1 - self.current_player]
+        mask = np.zeros((self.nb_games, g, g), dtype=bool)
+
+        # Walls padded with -2 (out of bound) so that any wall offset can be looked up
+        padded_walls = np.full((self.nb_games, g + 3, g + 3),
+                               -2,
+                               dtype=np.int8)
+        padded_walls[:, 2:-2, 2:-2] = self.walls
+
+        def wall_at(wall_offset):
+            return padded_walls[games, player_pos[:, 0] + wall_offset[0] + 2,
+                                player_pos[:, 1] + wall_offset[1] + 2]
+
+        def add_moves(pos_offset, valid):
+            target_position = player_pos + pos_offset
+            valid &= ((target_position >= 0) &
+                      (target_position < g)).all(axis=-1) & ~self.done
+            mask[games[valid], target_position[valid, 0],
+                 target_position[valid, 1]] = True
+
+        # 1. direct moves
+        for pos_offset, wall_offsets, wall_direction in DIRECT_OFFSETS:
+            valid = (player_pos + pos_offset != opponent_pos).any(axis=-1)
+            for wall_offset in wall_offsets:
+                valid &= wall_at(wall_offset) != wall_direction
+            add_moves(pos_offset, valid)
+
+        # 2. moves with hopping
+        for pos_offset, opponent_offset, required_wall_offsets, forbidden_wall_offsets in INDIRECT_OFFSETS:
+            valid = (player_pos + opponent_offset == opponent_pos).all(axis=-1)
+            # As in QuoridorEnv, only the first required wall in bound is checked
+            found_required_wall = np.ones(self.nb_games, dtype=bool)
+            for required_wall_offset, required_wall_direction in reversed(
+                    required_wall_offsets):
+                wall = wall_at(required_wall_offset)
+                found_required_wall = np.where(wall != -2,
+                                               wall == required_wall_direction,
+                                               found_required_wall)
+            valid &= found_required_wall
+            for forbidden_wall_offset, forbidden_wall_direction in forbidden_wall_offsets:
+                valid &= wall_at(
+                    forbidden_wall_offset) != forbidden_wall_direction
+            add_moves(pos_offset, valid)
+
+        return mask
+
+    def legal_action_mask(self) -> np.ndarray:
+        """Returns the mask of the actions the current player can take in every game (empty for finished games)
+
+        Returns:
+            np.ndarray: [N, nb_actions] boolean array indexed by action indices
+        """
+        g = self.grid_size
+        mask = np.zeros((self.nb_games, self.nb_actions), dtype=bool)
+        mask[:, :g * g] = self.legal_move_mask().reshape(self.nb_games, -1)
+        games = np.arange(self.nb_games)
+        has_walls = self.nb_walls[games, self.current_player] < self.max_walls
+        mask[:, g * g:] = self.legal_wall_mask().reshape(
+            self.nb_games, -1) & has_walls[:, None]
+        return mask
+
+    def instant_planes(self) -> np.ndarray:
+        """Generates the instantaneous planes of every game (see QuoridorRepresentation.generate_instant_planes)
+
+        Returns:
+            np.ndarray: [N, 3, g, g] float32 array
+        """
+        g = self.grid_size
+        games = np.arange(self.nb_games)
+        planes = np.zeros((self.nb_games, 3, g, g), dtype=np.float32)
+        for player_idx in range(2):
+            planes[games, player_idx, self.player_positions[:, player_idx, 0],
+                   self.player_positions[:, player_idx, 1]] = 1.0
+        planes[:, 2, :-1, :-1] = self.walls + 1
+        return planes
+
+    def observe(self) -> np.ndarray:
+        """Generates the state planes of every game (see QuoridorRepresentation.generate_state_planes)
+
+        Returns:
+            np.ndarray: [N, 3 * time_consistency + 3, g, g] float32 array
+        """
+        g = self.grid_size
+        games = np.arange(self.nb_games)
+        state_planes = np.zeros(
+            (self.nb_games, 3 * self.time_consistency + 3, g, g),
+            dtype=np.float32)
+        state_planes[:, :-3] = self.feature_planes.reshape(
+            self.nb_games, -1, g, g)
+        # Add constant-valued features (player colour and available walls)
+        player_walls = self.nb_walls[games, self.current_player]
+        opponent_walls = self.nb_walls[games, 1 - self.current_player]
+        state_planes[:, -3] = self.current_player[:, None, None]
+        state_planes[:, -2] = (self.max_walls - player_walls)[:, None, None]
+        state_planes[:, -1] = (self.max_walls - opponent_walls)[:, None, None]
+        # Rotate (180°) as in QuoridorRepresentation
+        return np.ascontiguousarray(np.flip(state_planes, axis=(2, 3)))
@@ -0,0 +1,118 @@
+import numpy as np
+from environment import QuoridorConfig, QuoridorState
+
+
+class BitboardWalls:
+    """Drop-in replacement for the (grid_size - 1)x(grid_size - 1) int8 wall array
+
+    Walls are stored as two Python int bitmasks (one per direction) where the bit
+    i * (grid_size - 1) + j stands for the intersection (i, j). Indexing follows the
+    NumPy array conventions used throughout the environment (walls[i, j] returns -1
+    for empty, 0 for a wall along x and 1 for a wall along y) and np.asarray(walls)
+    gives back the usual int8 array.
+    """
+
+    __slots__ = ("size", "horizontal", "vertical")
+
+    def __init__(self,
+                 size: int,
+                 horizontal: int = 0,
+                 vertical: int = 0) -> None:
+        self.size = size
+        self.horizontal = horizontal
+        self.vertical = vertical
+
+    @property
+    def shape(self):
+        return (self.size, self.size)
+
+    @property
+    def bits(self):
+        return (self.horizontal, self.vertical)
+
+    def __getitem__(self, position) -> int:
+        bit = 1 << (position[0] * self.size + position[1])
+        if self.horizontal & bit:
+            return 0
+        if self.vertical & bit:
+            return 1
+        return -1
+
+    def __setitem__(self, position, direction: int) -> None:
+        bit = 1 << (position[0] * self.size + position[1])
+        self.horizontal &= ~bit
+        self.vertical &= ~bit
+        if direction == 0:
+            self.horizontal |= bit
+        elif direction == 1:
+            self.vertical |= bit
+
+    def __array__(self, dtype=None, copy=None):
+        walls = np.full(self.size * self.size, -1, dtype=np.int8)
+        for direction, mask in enumerate(self.bits):
+            while mask:
+                lowest_bit = mask & -mask
+                walls[lowest_bit.bit_length() - 1] = direction
+                mask ^= lowest_bit
+        walls = walls.reshape(self.shape)
+        return walls if dtype is None else walls.astype(dtype)
+
+    def copy(self):
+        return BitboardWalls(self.size, self.horizontal, self.vertical)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(
+            other, BitboardWalls
+        ) and self.bits == other.bits and self.size == other.size
+
+    def __hash__(self) -> int:
+        return hash(self.bits)
+
+
+class BitboardQuoridorState(QuoridorState):
+    """Compact QuoridorState where walls are stored as bitmasks
+
+    It can be used everywhere a QuoridorState is expected (QuoridorEnv,
+    QuoridorRepresentation and the renderers) but copying and hashing it only
+    involves a handful of Python ints and two short lists.
+    NOTE: the hash depends on the content of the state, do not mutate a state
+    while it is used as a dictionary key.
+    """
+
+    def __init__(self, game_config: QuoridorConfig) -> None:
+        super().__init__(game_config)
+        self.walls = BitboardWalls(self.grid_size - 1)
+
+    @classmethod
+    def from_state(cls, state: QuoridorState):
+        """Converts any QuoridorState into its bitboard counterpart
+
+        Args:
+            state (QuoridorState): the state to convert
+
+        Returns:
+            BitboardQuoridorState: the converted state
+        """
+        new_state = cls.__new__(cls)
+        new_state.__dict__.update(state.copy().__dict__)
+        walls = BitboardWalls(state.grid_size - 1)
+        for i in range(state.grid_size - 1):
+            for j in range(state.grid_size - 1):
+                walls[i, j] = state.walls[i, j]
+        new_state.walls = walls
+        return new_state
+
+    def content(self):
+        # Tuple of everything that identifies a state (used for hashing and comparisons)
+        return (self.walls.horizontal, self.walls.vertical,
+                tuple(self.player_positions), tuple(self.nb_walls),
+                self.current_player, self.t)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(
+            other,
+            BitboardQuoridorState) and self.content() == other.content()
+
+    def __hash__(self) -> int:
+        # The Zobrist key already identifies the state
+        return self.key
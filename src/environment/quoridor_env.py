@@ -1,8 +1,9 @@
-from copy import deepcopy
+import numpy as np
 from environment import QuoridorState, MoveAction, QuoridorAction, WallAction, QuoridorConfig
+from environment.quoridor_state import wall_bit, get_wall_conflicts
 
 from utils import add_offset, is_in_bound, pathfinder
-from utils import PathFinder
+from utils import PathFinder, get_zobrist_table
 
 # Offsets are defined as (pos_offset, wall_offsets, wall_direction)
 DIRECT_OFFSETS = [((-1, 0), [(-1, 0), (-1, -1)], 1),
@@ -68,6 +69,19 @@ class QuoridorEnv:
         # initialize the pathfinder used to check valid wall placement
         self.pathfinder = PathFinder(self.grid_size)
 
+        # Zobrist keys used to update state keys incrementally
+        self.zobrist = get_zobrist_table(self.grid_size, self.max_walls,
+                                         self.max_t)
+
+        # Wall slots to remove from the state wall_mask when a wall is placed
+        self.wall_conflicts = get_wall_conflicts(self.grid_size)
+        self.nb_actions = game_config.nb_actions
+        # Components of every action index (see decode_action_index) so that pushing an index is a lookup
+        self.decoded_actions = [
+            self.decode_action_index(action_idx)
+            for action_idx in range(self.nb_actions)
+        ]
+
     def get_opponent(self, player_idx: int) -> int:
         """Returns the opponent of the provided player
 
@@ -79,6 +93,29 @@ class QuoridorEnv:
         """
         return (player_idx + 1) % self.nb_players
 
+    def decode_action_index(self, action_idx: int):
+        """Maps an action index to its components
+
+        Args:
+            action_idx (int): index of the action (as given by QuoridorAction.to_index)
+
+        Returns:
+            tuple[int, tuple[int, int], int]: action type (0 for moves, 1 for walls), target/wall position and wall direction (None for moves)
+        """
+        # Move pawn action
+        if action_idx < self.grid_size * self.grid_size:
+            return 0, (action_idx // self.grid_size,
+                       action_idx % self.grid_size), None
+        # Add wall
+        wall_idx = action_idx - self.grid_size * self.grid_size
+        wall_direction = 0
+        # Vertical wall
+        if wall_idx >= (self.grid_size - 1) * (self.grid_size - 1):
+            wall_direction = 1
+            wall_idx -= (self.grid_size - 1) * (self.grid_size - 1)
+        return 1, (wall_idx // (self.grid_size - 1),
+                   wall_idx % (self.grid_size - 1)), wall_direction
+
     def step_from_index(self, state: QuoridorState,
                         action_idx: int) -> QuoridorState:
         # Map action from its index
@@ -86,40 +123,103 @@ class QuoridorEnv:
             print("Invalid action!")
             return
 
+        action_type, position, wall_direction = self.decode_action_index(
+            action_idx)
+
         # Move pawn action
-        if action_idx < self.grid_size * self.grid_size:
-            target_pos = (action_idx // self.grid_size,
-                          action_idx % self.grid_size)
+        if action_type == 0:
             # TODO: remove this in production (should not be triggered)
-            if not self.can_move_pawn(state, target_pos):
+            if not self.can_move_pawn(state, position):
                 print(
-                    f"Cannot move player {state.current_player} at position {target_pos} in state: {state.to_string(add_nb_walls=True, add_current_player=True)}!"
+                    f"Cannot move player {state.current_player} at position {position} in state: {state.to_string(add_nb_walls=True, add_current_player=True)}!"
                 )
                 return
 
-            next_state = self.move_pawn(state, target_pos)
+            next_state = self.move_pawn(state, position)
         # Add wall
         else:
-            wall_idx = action_idx - self.grid_size * self.grid_size
-            wall_direction = 0
-            # Vertical wall
-            if wall_idx >= (self.grid_size - 1) * (self.grid_size - 1):
-                wall_direction = 1
-                wall_idx -= (self.grid_size - 1) * (self.grid_size - 1)
-            wall_position = (wall_idx // (self.grid_size - 1),
-                             wall_idx % (self.grid_size - 1))
-
             # NOTE: remove this in production (should not be triggered)
-            # if not self.can_add_wall(state, wall_position, wall_direction):
+            # if not self.can_add_wall(state, position, wall_direction):
             #     print(
-            #         f"{state.current_player} cannot add wall at position {wall_position} and with direction {wall_direction} in state: {state.to_string(add_nb_walls=True, add_current_player=True)}"
+            #         f"{state.current_player} cannot add wall at position {position} and with direction {wall_direction} in state: {state.to_string(add_nb_walls=True, add_current_player=True)}"
             #     )
             #     return
 
-            next_state = self.add_wall(state, wall_position, wall_direction)
+            next_state = self.add_wall(state, position, wall_direction)
 
         return next_state
 
+    def push(self, state: QuoridorState,
+             action: QuoridorAction) -> QuoridorState:
+        """Executes an action in place and records what is needed to revert it with pop.
+        Searches can then walk a single mutable state instead of copying it at every node.
+
+        Args:
+            state (QuoridorState): the state to modify
+            action (QuoridorAction): action to execute (assumed to be valid)
+
+        Returns:
+            QuoridorState: the modified state
+        """
+        if action.type == 0:
+            return self._push(state, 0, action.player_pos, None)
+        return self._push(state, 1, action.wall_position,
+                          action.wall_direction)
+
+    def push_from_index(self, state: QuoridorState,
+                        action_idx: int) -> QuoridorState:
+        """Same as push but with the action provided as an index
+
+        Args:
+            state (QuoridorState): the state to modify
+            action_idx (int): index of the action to execute (assumed to be valid)
+
+        Returns:
+            QuoridorState: the modified state
+        """
+        return self._push(state, *self.decoded_actions[action_idx])
+
+    def _push(self, state: QuoridorState, action_type: int, position,
+              wall_direction: int) -> QuoridorState:
+        player_idx = state.current_player
+        # Undo records are (player_idx, action_type, position, previous player position, t, done, winner, key, legal walls, wall record)
+        # NOTE: the wall record (ufind checkpoint and wall mask) is only saved for walls since moves do not modify them
+        state.undo_records.append(
+            (player_idx, action_type, position,
+             state.player_positions[player_idx], state.t, state.done,
+             state.winner, state.key, state.legal_walls,
+             (state.ufind.checkpoint(),
+              state.wall_mask) if action_type == 1 else None))
+        if action_type == 0:
+            return self.move_pawn(state, position)
+        return self.add_wall(state, position, wall_direction)
+
+    def pop(self, state: QuoridorState) -> QuoridorState:
+        """Reverts the last action executed with push
+
+        Args:
+            state (QuoridorState): the state to restore
+
+        Returns:
+            QuoridorState: the restored state
+        """
+        undo_record = state.undo_records.pop()
+        player_idx, action_type, position, player_position, t, done, winner, key, legal_walls, wall_record = undo_record
+        if action_type == 0:
+            state.player_positions[player_idx] = player_position
+        else:
+            state.walls[position] = -1
+            state.nb_walls[player_idx] -= 1
+            ufind_mark, state.wall_mask = wall_record
+            state.ufind.rollback(ufind_mark)
+        state.current_player = player_idx
+        state.t = t
+        state.done = done
+        state.winner = winner
+        state.key = key
+        state.legal_walls = legal_walls
+        return state
+
     def can_move_pawn(self, state: QuoridorState, target_position) -> bool:
         """Checks that a given player can move in a provided position
 
@@ -200,7 +300,14 @@ class QuoridorEnv:
             target_position (_type_): targeted position
         """
         player_idx = state.current_player
+        # Update the key incrementally
+        state.key ^= self.zobrist.pawn_key(player_idx,
+                                           state.player_positions[player_idx])
+        state.key ^= self.zobrist.pawn_key(player_idx, target_position)
+        state.key ^= self.zobrist.turn_key(state.t)
         state.player_positions[player_idx] = target_position
+        # NOTE: moving a pawn can change the walls that would cut its path
+        state.legal_walls = None
         state.current_player = self.get_opponent(player_idx)
         state.t += 1
         state.done = self.player_win(state,
@@ -242,29 +349,32 @@ class QuoridorEnv:
         player_idx = state.current_player
         # Make sure the player has not used all of its walls yet
         if state.nb_walls[player_idx] >= self.max_walls:
-            return
-        # Make sure the intersection is not already used by a wall
-        if state.walls[wall_position] != -1:
             return False
 
-        # Check potential intersections
-        if direction == 0:
-            # One cannot place walls if there is already a wall of the same direction in the axis-aligned adjacent intersections
-            if wall_position[0] > 0 and state.walls[(wall_position[0] - 1,
-                                                     wall_position[1])] == 0:
-                return False
-            if wall_position[0] < self.grid_size - 2 and state.walls[(
-                    wall_position[0] + 1, wall_position[1])] == 0:
-                return False
-        if direction == 1:
-            # One cannot place walls if there is already a wall of the same direction in the axis-aligned adjacent intersections
-            if wall_position[1] > 0 and state.walls[(
-                    wall_position[0], wall_position[1] - 1)] == 1:
-                return False
-            if wall_position[1] < self.grid_size - 2 and state.walls[(
-                    wall_position[0], wall_position[1] + 1)] == 0:
-                return False
+        # Make sure the intersection is not already used by a wall and that
+        # there is no wall of the same direction in the axis-aligned adjacent intersections
+        bit = 1 << wall_bit(wall_position, direction, self.grid_size)
+        if not state.wall_mask & bit:
+            return False
+
+        # Use the cached legal walls if they are up to date
+        if state.legal_walls is not None:
+            return bool(state.legal_walls & bit)
+
+        return self.check_wall_path(state, wall_position, direction)
+
+    def check_wall_path(self, state: QuoridorState, wall_position,
+                        direction: int) -> bool:
+        """Checks that adding a wall (assumed to be free) still lets every player reach its goal
+
+        Args:
+            state (QuoridorState): the current state
+            wall_position (_type_): position of the wall
+            direction (int): direction of the wall
 
+        Returns:
+            bool: True if the wall can be added, False otherwise
+        """
         # Test new wall connected components
         new_wall_cc = state.ufind.check_wall(wall_position, direction)
         # If necessary, perform pathfinding
@@ -279,18 +389,41 @@ class QuoridorEnv:
                     return False
             state.walls[wall_position] = -1
 
-        # # Test pathfinding i.e make sure he cannot block the opponent from reaching its goal (in practice, he can block himself)
-        # state.walls[wall_position] = direction
-        # for i in range(self.nb_players):
-        #     if not self.pathfinder.check_path(
-        #             state.walls, state.player_positions[i], self.x_targets[i]):
-        #         state.walls[wall_position] = -1
-        #         return False
-        # state.walls[wall_position] = -1
-        # Test connected components with UFind heuristic
-
         return True
 
+    def get_legal_walls(self, state: QuoridorState) -> int:
+        """Returns the bitmask of the wall slots (see wall_bit) where a wall can be placed (regardless of the number of walls left).
+        Free slots are maintained incrementally in state.wall_mask. One shortest path is computed per player and only the free slots
+        that cut one of these paths and may close a loop (according to the ufind structure) are checked with pathfinding.
+        The result is cached in the state until the next action.
+
+        Args:
+            state (QuoridorState): the current state
+
+        Returns:
+            int: bitmask of the legal wall slots
+        """
+        if state.legal_walls is None:
+            nb_intersections = (self.grid_size - 1) * (self.grid_size - 1)
+            legal_walls = state.wall_mask
+            # Walls that do not touch a shortest path of each player cannot disconnect them
+            candidates = 0
+            for i in range(self.nb_players):
+                path_cuts = self.pathfinder.get_path_cuts(
+                    state.walls, state.player_positions[i], self.x_targets[i])
+                candidates |= legal_walls if path_cuts is None else path_cuts
+            candidates &= legal_walls
+            while candidates:
+                bit = candidates & -candidates
+                candidates ^= bit
+                direction, wall_idx = divmod(bit.bit_length() - 1,
+                                             nb_intersections)
+                wall_position = divmod(wall_idx, self.grid_size - 1)
+                if not self.check_wall_path(state, wall_position, direction):
+                    legal_walls ^= bit
+            state.legal_walls = legal_walls
+        return state.legal_walls
+
     def add_wall(self, state: QuoridorState, wall_position,
                  direction: int) -> QuoridorState:
         """Adds a wall requested by a specific player
@@ -301,9 +434,19 @@ class QuoridorEnv:
             direction (int): direction of the wall
         """
         player_idx = state.current_player
+        # Update the key incrementally
+        state.key ^= self.zobrist.wall_key(wall_position, direction)
+        state.key ^= self.zobrist.nb_walls[player_idx][
+            state.nb_walls[player_idx]] ^ self.zobrist.nb_walls[player_idx][
+                state.nb_walls[player_idx] + 1]
+        state.key ^= self.zobrist.turn_key(state.t)
         state.nb_walls[player_idx] += 1
         state.walls[wall_position] = direction
         state.ufind.add_wall(wall_position, direction)
+        # Only the overlapping slots are removed from the wall mask, then legal walls are recomputed lazily
+        state.wall_mask &= ~self.wall_conflicts[wall_bit(
+            wall_position, direction, self.grid_size)]
+        state.legal_walls = None
         state.current_player = self.get_opponent(player_idx)
         state.t += 1
         state.done = self.player_win(state,
@@ -319,18 +462,31 @@ class QuoridorEnv:
         """
         possible_actions = []
 
-        player_pos = state.player_positions[state.current_player]
-
         # If the player has not used all of its walls, check the walls he can place
         # Note: in practice, this is redundant but it prevents from looping
         if state.nb_walls[state.current_player] < self.max_walls:
+            legal_walls = self.get_legal_walls(state)
             for i in range(self.grid_size - 1):
                 for j in range(self.grid_size - 1):
                     for direction in range(2):
-                        if self.can_add_wall(state, (i, j), direction):
+                        if legal_walls >> wall_bit(
+                            (i, j), direction, self.grid_size) & 1:
                             possible_actions.append(
                                 WallAction((i, j), direction))
 
+        # Return the full list of actions
+        return possible_actions + self.get_possible_moves(state)
+
+    def get_possible_moves(self, state: QuoridorState):
+        """Returns a list with all the pawn moves the current player can take
+
+        Returns:
+            list[MoveAction]: list of move actions
+        """
+        possible_actions = []
+
+        player_pos = state.player_positions[state.current_player]
+
         # Check the move actions the player can perform
         # 1. direct moves
         for pos_offset, wall_offsets, wall_direction in DIRECT_OFFSETS:
@@ -391,9 +547,30 @@ class QuoridorEnv:
                     possible_actions.append(
                         MoveAction(target_position, state.current_player))
 
-        # Return the full list of actions
         return possible_actions
 
+    def legal_action_mask(self, state: QuoridorState) -> np.ndarray:
+        """Returns the mask of the actions the current player can take
+
+        Args:
+            state (QuoridorState): the current state
+
+        Returns:
+            np.ndarray: boolean vector of length nb_actions indexed by action indices
+        """
+        mask = np.zeros(self.nb_actions, dtype=bool)
+        for action in self.get_possible_moves(state):
+            mask[action.to_index(self.grid_size)] = True
+        if state.nb_walls[state.current_player] < self.max_walls:
+            nb_wall_slots = self.nb_actions - self.grid_size * self.grid_size
+            wall_bytes = self.get_legal_walls(state).to_bytes(
+                (nb_wall_slots + 7) // 8, "little")
+            mask[self.grid_size * self.grid_size:] = np.unpackbits(
+                np.frombuffer(wall_bytes, dtype=np.uint8),
+                count=nb_wall_slots,
+                bitorder="little")
+        return mask
+
     def act(self, state, action):
         """If permitted, execute action
         
@@ -403,7 +580,7 @@ class QuoridorEnv:
         Returns:
             QuoridorState: resulting state
         """
-        new_state = deepcopy(state)
+        new_state = state.copy()
         if action.type == 0:
             self.move_pawn(new_state, action.player_pos)
         else:
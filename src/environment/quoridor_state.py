@@ -1,6 +1,6 @@
 import numpy as np
 from environment import QuoridorConfig
-from utils import string_to_coords, UFindCC
+from utils import string_to_coords, is_in_bound, UFindCC, get_zobrist_table
 
 # TODO: extand this in case of bigger grid_size
 XGRAD = ["1", "2", "3", "4", "5", "6", "7", "8", "9"]
@@ -8,6 +8,43 @@ YGRAD = ["a", "b", "c", "d", "e", "f", "g", "h", "i"]
 DIRGRAD = ["h", "v"]
 
 
+def wall_bit(wall_position, direction: int, grid_size: int) -> int:
+    """Returns the index of a wall slot in the wall bitmasks of QuoridorState
+    (i.e. the index of the corresponding WallAction minus grid_size * grid_size)
+    """
+    return direction * (grid_size - 1) * (grid_size - 1) + wall_position[0] * (
+        grid_size - 1) + wall_position[1]
+
+
+WALL_CONFLICTS = {}
+
+
+def get_wall_conflicts(grid_size: int):
+    """Returns, for each wall slot, the bitmask of the slots that cannot be used anymore once a wall is placed there
+    (i.e. both directions at the same intersection and the axis-aligned adjacent slots of the same direction)
+    """
+    if grid_size not in WALL_CONFLICTS:
+        conflicts = []
+        for direction in range(2):
+            for i in range(grid_size - 1):
+                for j in range(grid_size - 1):
+                    conflict_positions = [((i, j), 0), ((i, j), 1)]
+                    if direction == 0:
+                        conflict_positions += [((i - 1, j), 0),
+                                               ((i + 1, j), 0)]
+                    else:
+                        conflict_positions += [((i, j - 1), 1),
+                                               ((i, j + 1), 1)]
+                    mask = 0
+                    for position, conflict_direction in conflict_positions:
+                        if is_in_bound(position, grid_size - 1):
+                            mask |= 1 << wall_bit(position, conflict_direction,
+                                                  grid_size)
+                    conflicts.append(mask)
+        WALL_CONFLICTS[grid_size] = conflicts
+    return WALL_CONFLICTS[grid_size]
+
+
 class QuoridorState:
     def __init__(self, game_config: QuoridorConfig) -> None:
         self.grid_size = game_config.grid_size
@@ -38,6 +75,37 @@ class QuoridorState:
         # initialize ufind structure used to test whether a new cc is added
         self.ufind = UFindCC(self.grid_size)
 
+        # bitmasks over wall slots (see wall_bit) used to generate legal walls incrementally:
+        # - wall_mask: slots that are free and do not overlap any placed wall (updated when a wall is added)
+        # - legal_walls: cached legal slots (None when they must be recomputed, i.e. after any action)
+        self.wall_mask = (1 << 2 * (self.grid_size - 1) *
+                          (self.grid_size - 1)) - 1
+        self.legal_walls = None
+
+        # stack of the records used by QuoridorEnv.pop to revert actions executed with QuoridorEnv.push
+        self.undo_records = []
+
+        # 64-bit Zobrist key of the state, maintained incrementally by QuoridorEnv
+        self.zobrist = get_zobrist_table(self.grid_size, game_config.max_walls,
+                                         game_config.max_t)
+        self.key = self.zobrist.hash_state(self)
+
+    def copy(self):
+        """Returns an independent copy of the state (much cheaper than deepcopy)
+
+        Returns:
+            QuoridorState: the copied state
+        """
+        new_state = self.__class__.__new__(self.__class__)
+        new_state.__dict__.update(self.__dict__)
+        # Positions are immutable tuples, so shallow copies of the lists are enough
+        new_state.player_positions = list(self.player_positions)
+        new_state.nb_walls = list(self.nb_walls)
+        new_state.walls = self.walls.copy()
+        new_state.ufind = self.ufind.copy()
+        new_state.undo_records = []
+        return new_state
+
     def load_from_string(self, state_str: str):
         splits = state_str.split(";")
         # Map positions
@@ -57,6 +125,17 @@ class QuoridorState:
         print(splits[len(splits) - 2].split(":"))
         self.t = int(splits[len(splits) - 2].split(":")[1])
         print(self.t)
+        # Recompute the key and the wall masks from scratch
+        self.key = self.zobrist.hash_state(self)
+        wall_conflicts = get_wall_conflicts(self.grid_size)
+        self.wall_mask = (1 << 2 * (self.grid_size - 1) *
+                          (self.grid_size - 1)) - 1
+        for i in range(self.grid_size - 1):
+            for j in range(self.grid_size - 1):
+                if self.walls[i, j] >= 0:
+                    self.wall_mask &= ~wall_conflicts[wall_bit(
+                        (i, j), self.walls[i, j], self.grid_size)]
+        self.legal_walls = None
 
     def to_string(self,
                   invariance=False,
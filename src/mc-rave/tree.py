@@ -1,7 +1,6 @@
 from collections import defaultdict
 import numpy as np
 from tqdm import trange
-from copy import deepcopy
 
 
 class MCTSNode():
@@ -65,7 +64,9 @@ class MCTSNode():
         return self.env.is_game_over(self.state)
 
     def rollout(self):
-        current_rollout_state = deepcopy(self.state)
+        # The rollout is played in place with push/pop and the node state is restored at the end
+        current_rollout_state = self.state
+        nb_undo_records = len(current_rollout_state.undo_records)
         player = self.player_idx
         actions = []
         while not (current_rollout_state.done
@@ -79,13 +80,15 @@ class MCTSNode():
             possible_actions = actions
             action = self.rollout_policy(possible_actions,
                                          current_rollout_state)
-            current_rollout_state = self.env.actNoCopy(current_rollout_state,
-                                                       action)
+            current_rollout_state = self.env.push(current_rollout_state,
+                                                  action)
             player = self.env.get_opponent(player)
             actions.append(action)
-        if self.env.player_win(current_rollout_state, self.player_idx):
-            return 1, actions
-        return -1, actions
+        result = 1 if self.env.player_win(current_rollout_state,
+                                          self.player_idx) else -1
+        while len(current_rollout_state.undo_records) > nb_undo_records:
+            self.env.pop(current_rollout_state)
+        return result, actions
 
     def backpropagate(self, result, actions):
         self._nb_visited += 1
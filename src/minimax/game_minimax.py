@@ -1,5 +1,4 @@
 from argparse import Action
-import copy
 import sys
 import os
 import pygame as pg
@@ -151,17 +150,15 @@ def best_action(env: QuoridorEnv, state: QuoridorState) -> Action:
     else:
         best_score = float('-inf')
         best_move = None
+        # Leaf evaluations shared between all the explored branches (keyed by state keys)
+        transpositions = {}
         for action in cur_actions:
             #apply action to get possible board
-            #do a copy of the state to apply action on it without altering real current state of the board
-            #copy_position_player = state.player_positions[state.current_player]
-            copy_state = copy.deepcopy(state)
-            copy_env = copy.deepcopy(env)
-            #print(action)
+            #push/pop the action so that the real current state of the board is restored afterwards
+            env.push(state, action)
 
-            copy_env.actNoCopy(copy_state, action)
-
-            score = minimax(copy_env, copy_state, 0, False)
+            score = minimax(env, state, 0, False, transpositions)
+            env.pop(state)
             #print(score)
             if score > best_score:
                 #print(best_score)
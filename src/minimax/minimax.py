@@ -1,13 +1,18 @@
-import copy
 from environment import QuoridorEnv
 from environment import QuoridorState
 from minimax.board_graph import BoardGraph
 from utils.coords import coords_to_tile
 
 
-def minimax(env: QuoridorEnv, state: QuoridorState, depth: int,
-            is_maximizing: bool):
+def minimax(env: QuoridorEnv,
+            state: QuoridorState,
+            depth: int,
+            is_maximizing: bool,
+            transpositions: dict = None):
     if depth == 2:
+        # Leaf evaluations only depend on the state so they are cached with its Zobrist key
+        if transpositions is not None and state.key in transpositions:
+            return transpositions[state.key]
         f1 = position_feature(state, state.current_player)
         f2 = position_difference(env, state)
         f3 = move_to_next_col_feature(
@@ -16,29 +21,29 @@ def minimax(env: QuoridorEnv, state: QuoridorState, depth: int,
             state,
             env.get_opponent(state.current_player))  #max_Advmove_next_col
         score = f1 + f2 + f3 - f4
+        if transpositions is not None:
+            transpositions[state.key] = score
         return score
 
+    # NOTE: actions are explored with push/pop so that the state is left untouched
     if is_maximizing:
         best_score = float('-inf')
-        copy_state = copy.deepcopy(state)
-        copy_env = copy.deepcopy(env)
         #maximizing : current player
-        list_actions = copy_env.get_possible_actions(copy_state)
+        list_actions = env.get_possible_actions(state)
         for action in list_actions:
-            copy_env.actNoCopy(copy_state, action)
-            score = minimax(copy_env, copy_state, depth + 1, False)
+            env.push(state, action)
+            score = minimax(env, state, depth + 1, False, transpositions)
+            env.pop(state)
             best_score = max(score, best_score)
         return best_score
     else:
         best_score = float('inf')
-        copy_state = copy.deepcopy(state)
-        copy_env = copy.deepcopy(env)
         #minimizing : opponent
-        #copy_state.current_player = (state.current_player + 1) % env.nb_players
-        list_actions = env.get_possible_actions(copy_state)
+        list_actions = env.get_possible_actions(state)
         for action in list_actions:
-            copy_env.actNoCopy(copy_state, action)
-            score = minimax(copy_env, copy_state, depth + 1, True)
+            env.push(state, action)
+            score = minimax(env, state, depth + 1, True, transpositions)
+            env.pop(state)
             best_score = min(score, best_score)
         return best_score
 
@@ -2,4 +2,5 @@ from .coords import add_offset, is_in_bound, tile_to_coords, coords_to_tile, cha
 from .ufind import UnionFind
 from .ufind_cc import UFindCC
 from .pathfinder import PathFinder
-from .history import read_history, write_history
\ No newline at end of file
+from .history import read_history, write_history
+from .zobrist import ZobristTable, get_zobrist_table
@@ -1,101 +1,166 @@
-from queue import PriorityQueue, Queue
-import queue
+from collections import deque
 import numpy as np
 from utils import is_in_bound
 
 
+NEIGHBOUR_TABLES = {}
+
+
+def get_neighbour_table(grid_size: int):
+    """Returns, for each cell (x, y), the list of its in-bound neighbours along with the
+    wall direction, the (in-bound) wall slots that block the corresponding edge and their bitmask
+    (with the slot indices of QuoridorState wall bitmasks, i.e. direction * (grid_size - 1)^2 + i * (grid_size - 1) + j)
+    (i.e. table[x][y] = [(neighbour, blocking_direction, blocking_walls, blocking_bits), ...])
+    """
+    if grid_size not in NEIGHBOUR_TABLES:
+        # Same order as the original expansion: up x, down y, down x, up y
+        # Moves along x are blocked by walls along y (1) and conversely
+        edges = [((-1, 0), [(-1, -1), (-1, 0)], 1),
+                 ((0, -1), [(-1, -1), (0, -1)], 0),
+                 ((1, 0), [(0, -1), (0, 0)], 1),
+                 ((0, 1), [(-1, 0), (0, 0)], 0)]
+        table = []
+        for x in range(grid_size):
+            row = []
+            for y in range(grid_size):
+                cell_edges = []
+                for pos_offset, wall_offsets, blocking_direction in edges:
+                    neighbour = (x + pos_offset[0], y + pos_offset[1])
+                    if not is_in_bound(neighbour, grid_size):
+                        continue
+                    blocking_walls = tuple(
+                        (x + wall_offset[0], y + wall_offset[1])
+                        for wall_offset in wall_offsets
+                        if is_in_bound((x + wall_offset[0],
+                                        y + wall_offset[1]), grid_size - 1))
+                    blocking_bits = 0
+                    for wall in blocking_walls:
+                        blocking_bits |= 1 << (
+                            blocking_direction * (grid_size - 1) *
+                            (grid_size - 1) + wall[0] *
+                            (grid_size - 1) + wall[1])
+                    cell_edges.append((neighbour, blocking_direction,
+                                       blocking_walls, blocking_bits))
+                row.append(cell_edges)
+            table.append(row)
+        NEIGHBOUR_TABLES[grid_size] = table
+    return NEIGHBOUR_TABLES[grid_size]
+
+
 class PathFinder:
-    def __init__(self, grid_size: int) -> None:
+    def __init__(self, grid_size: int, cache_size: int = 4096) -> None:
         self.grid_size = grid_size
+        # distance reported for cells that cannot reach their target row
+        self.unreachable = grid_size * grid_size
+        # neighbours (and blocking wall slots) of every cell, shared by every PathFinder of this grid size
+        self.neighbour_table = get_neighbour_table(grid_size)
+        # distance maps indexed by (wall configuration, x_target), the oldest ones are evicted first
+        self.cache_size = cache_size
+        self.distance_cache = {}
 
     def get_neighbours(self, walls, pos):
         neighbours = []
-        # TODO: clean that!
-        if pos[0] > 0:
-            wall_1 = (pos[0] - 1, pos[1] - 1)
-            wall_2 = (pos[0] - 1, pos[1])
-            if (walls[wall_1] != 1 if is_in_bound(wall_1, self.grid_size - 1)
-                    else True) and (walls[wall_2] != 1 if is_in_bound(
-                        wall_2, self.grid_size - 1) else True):
-                neighbours.append((pos[0] - 1, pos[1]))
-
-        if pos[1] > 0:
-            wall_1 = (pos[0] - 1, pos[1] - 1)
-            wall_2 = (pos[0], pos[1] - 1)
-            if (walls[wall_1] != 0 if is_in_bound(wall_1, self.grid_size - 1)
-                    else True) and (walls[wall_2] != 0 if is_in_bound(
-                        wall_2, self.grid_size - 1) else True):
-                neighbours.append((pos[0], pos[1] - 1))
-
-        if pos[0] < self.grid_size - 1:
-            wall_1 = (pos[0], pos[1] - 1)
-            wall_2 = (pos[0], pos[1])
-            if (walls[wall_1] != 1 if is_in_bound(wall_1, self.grid_size - 1)
-                    else True) and (walls[wall_2] != 1 if is_in_bound(
-                        wall_2, self.grid_size - 1) else True):
-                neighbours.append((pos[0] + 1, pos[1]))
-
-        if pos[1] < self.grid_size - 1:
-            wall_1 = (pos[0] - 1, pos[1])
-            wall_2 = (pos[0], pos[1])
-            if (walls[wall_1] != 0 if is_in_bound(wall_1, self.grid_size - 1)
-                    else True) and (walls[wall_2] != 0 if is_in_bound(
-                        wall_2, self.grid_size - 1) else True):
-                neighbours.append((pos[0], pos[1] + 1))
-
+        for neighbour, blocking_direction, blocking_walls, _ in self.neighbour_table[
+                pos[0]][pos[1]]:
+            for wall in blocking_walls:
+                if walls[wall] == blocking_direction:
+                    break
+            else:
+                neighbours.append(neighbour)
         return neighbours
 
     def manhattan_distance(self, pos1, pos2):
         return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
 
+    def distance_map(self, walls, x_target) -> np.ndarray:
+        """Returns the distance of every cell to the target row, computed with a single
+        multi-source BFS from that row and cached per wall configuration
+
+        Args:
+            walls (np.ndarray): (grid_size - 1)x(grid_size - 1) wall array
+            x_target (int): the target row
+
+        Returns:
+            np.ndarray: grid_size x grid_size distances (self.unreachable if the row cannot be reached)
+        """
+        # NOTE: walls may also be a BitboardWalls (converted to the usual int8 array)
+        walls = np.asarray(walls)
+        cache_key = (walls.tobytes(), x_target)
+        dist = self.distance_cache.get(cache_key)
+        if dist is not None:
+            return dist
+
+        # Plain lists are much faster than NumPy arrays for element-wise accesses
+        wall_list = walls.tolist()
+        dist = [[self.unreachable] * self.grid_size
+                for _ in range(self.grid_size)]
+        frontier = deque()
+        for y in range(self.grid_size):
+            dist[x_target][y] = 0
+            frontier.append((x_target, y))
+        while frontier:
+            current_pos = frontier.popleft()
+            next_dist = dist[current_pos[0]][current_pos[1]] + 1
+            # Edges are undirected so the neighbours of current_pos are also its predecessors
+            for neighbour, blocking_direction, blocking_walls, _ in self.neighbour_table[
+                    current_pos[0]][current_pos[1]]:
+                if dist[neighbour[0]][neighbour[1]] != self.unreachable:
+                    continue
+                for wall in blocking_walls:
+                    if wall_list[wall[0]][wall[1]] == blocking_direction:
+                        break
+                else:
+                    dist[neighbour[0]][neighbour[1]] = next_dist
+                    frontier.append(neighbour)
+
+        dist = np.array(dist, dtype=np.int64)
+        if len(self.distance_cache) >= self.cache_size:
+            del self.distance_cache[next(iter(self.distance_cache))]
+        self.distance_cache[cache_key] = dist
+        return dist
+
     # TODO: handle mutliple dimensions (i.e remove x_target and add other heuristics)
     def check_path(self, walls, player_pos, x_target) -> bool:
-        seen = np.zeros((self.grid_size, self.grid_size), dtype=np.uint8)
-        unseen = PriorityQueue()
-        unseen.put((0, player_pos))
-        while not unseen.empty():
-            _, current_pos = unseen.get()
-            # Mark current_pos as "seen"
-            seen[current_pos] = 1
-            neighbours = self.get_neighbours(walls, current_pos)
-            # print(f'{current_pos} - {self.get_neighbours(walls, current_pos)}')
-            for neighbour in neighbours:
-                if seen[neighbour] != 1:
-                    if neighbour[0] == x_target:
-                        # print(
-                        #     f"PathFinder: path found from {player_pos} to {neighbour}"
-                        # )
-                        return True
-                    else:
-                        cost = 1 + abs(neighbour[0] - x_target)
-                        unseen.put((cost, neighbour))
-        # print(
-        #     f"PathFinder: path NOT found from {player_pos} to {x_target} x_target"
-        # )
-        return False
-
-    # Find shortest path with Djikstra
+        return self.distance_map(walls, x_target)[
+            player_pos] != self.unreachable
+
+    # Find shortest path with a (cached) BFS from the target row
     def find_shortest(self, walls, player_pos, x_target) -> int:
-        dist = self.grid_size * self.grid_size * np.ones(
-            (self.grid_size, self.grid_size), dtype=np.uint8)
-        seen = self.grid_size * self.grid_size * np.zeros(
-            (self.grid_size, self.grid_size), dtype=np.uint8)
-        queue = PriorityQueue()
-        queue.put((0, player_pos))
-        dist[player_pos] = 0
-        seen[player_pos] = 1
-        shortest_to_target = self.grid_size * self.grid_size
-        while not queue.empty():
-            _, current_pos = queue.get()
-            neighbours = self.get_neighbours(walls, current_pos)
-            for neighbour in neighbours:
-                if dist[current_pos] + 1 < dist[neighbour]:
-                    dist[neighbour] = dist[current_pos] + 1
-                if neighbour[0] == x_target and dist[
-                        neighbour] < shortest_to_target:
-                    shortest_to_target = dist[neighbour]
-                if seen[neighbour] != 1:
-                    seen[neighbour] = 1
-                    queue.put((dist[neighbour], neighbour))
         # Convert to int otherwise will raise issue when substracting results
-        return int(shortest_to_target)
+        return int(self.distance_map(walls, x_target)[player_pos])
+
+    def get_path_cuts(self, walls, player_pos, x_target):
+        """Returns the bitmask of the wall slots that block an edge of one shortest path to the target row.
+        A wall outside of this mask leaves that path untouched and thus cannot disconnect the player.
+
+        Args:
+            walls (np.ndarray): (grid_size - 1)x(grid_size - 1) wall array
+            player_pos (tuple[int, int]): the starting position
+            x_target (int): the target row
+
+        Returns:
+            int | None: bitmask of the wall slots (None if the target row cannot be reached)
+        """
+        walls = np.asarray(walls)
+        dist = self.distance_map(walls, x_target)
+        if dist[player_pos] == self.unreachable:
+            return None
+        wall_list = walls.tolist()
+        cuts = 0
+        current_pos = player_pos
+        current_dist = int(dist[current_pos])
+        # Walk down the distance map, one free edge at a time
+        while current_dist > 0:
+            for neighbour, blocking_direction, blocking_walls, blocking_bits in self.neighbour_table[
+                    current_pos[0]][current_pos[1]]:
+                if dist[neighbour] != current_dist - 1:
+                    continue
+                for wall in blocking_walls:
+                    if wall_list[wall[0]][wall[1]] == blocking_direction:
+                        break
+                else:
+                    cuts |= blocking_bits
+                    current_pos = neighbour
+                    current_dist -= 1
+                    break
+        return cuts
@@ -1,3 +1,4 @@
+from array import array
 from utils import coords_to_tile, add_offset, is_in_bound, tile_to_coords
 
 OFFSETS_X = (((-2, 0), 0), ((2, 0), 0), ((-1, -1), 1), ((0, -1), 1),
@@ -6,15 +7,54 @@ OFFSETS_Y = (((0, -2), 1), ((0, 2), 1), ((-1, -1), 0), ((-1, 0), 0),
              ((-1, 1), 0), ((1, -1), 0), ((1, 0), 0), ((1, 1), 0))
 
 
-# Basic union-find structure with parents flattening for O(1) queries
+# Array-backed union-find structure (path halving and union by rank, border roots always win)
+# Every write is recorded in an undo log so that walls can be reverted with rollback instead of copying the structure
 class UFindCC:
     def __init__(self, grid_size: int) -> None:
         # Initialize as many elements as there are possible wall spots
         self.nb_elements = 2 * (grid_size - 1) * (grid_size - 1) + 4
         self.border_threshold = 2 * (grid_size - 1) * (grid_size - 1)
         self.grid_size = grid_size
-        self.parents = [(-1 if i < self.border_threshold else i)
-                        for i in range(self.nb_elements)]
+        self.parents = array("h", [(-1 if i < self.border_threshold else i)
+                                   for i in range(self.nb_elements)])
+        self.ranks = array("b", [0] * self.nb_elements)
+        # Flat (index, previous value) pairs, indices >= nb_elements refer to ranks
+        self.undo_log = array("h")
+
+    def copy(self):
+        new_ufind = UFindCC.__new__(UFindCC)
+        new_ufind.nb_elements = self.nb_elements
+        new_ufind.border_threshold = self.border_threshold
+        new_ufind.grid_size = self.grid_size
+        new_ufind.parents = array("h", self.parents)
+        new_ufind.ranks = array("b", self.ranks)
+        # A copy cannot be rolled back beyond its creation
+        new_ufind.undo_log = array("h")
+        return new_ufind
+
+    def checkpoint(self) -> int:
+        """Returns a mark to pass to rollback to revert all the subsequent modifications"""
+        return len(self.undo_log)
+
+    def rollback(self, mark: int) -> None:
+        """Reverts all the modifications made since the provided checkpoint
+
+        Args:
+            mark (int): value returned by checkpoint
+        """
+        undo_log = self.undo_log
+        while len(undo_log) > mark:
+            previous_value = undo_log.pop()
+            idx = undo_log.pop()
+            if idx < self.nb_elements:
+                self.parents[idx] = previous_value
+            else:
+                self.ranks[idx - self.nb_elements] = previous_value
+
+    def set_parent(self, i, parent) -> None:
+        self.undo_log.append(i)
+        self.undo_log.append(self.parents[i])
+        self.parents[i] = parent
 
     def wall_to_tile(self, pos, direction):
         if direction == 0:
@@ -46,14 +86,14 @@ class UFindCC:
         # Test borders directly
         tile = self.wall_to_tile(pos, direction)
         if pos[direction] == 0:
-            self.parents[tile] = self.border_threshold + direction
+            self.set_parent(tile, self.border_threshold + direction)
             if verbose:
                 print(
                     f"Parent of {pos} is now {self.border_threshold + direction} (threshold at {self.border_threshold})"
                 )
             return
         if pos[direction] == self.grid_size - 2:
-            self.parents[tile] = self.border_threshold + direction + 2
+            self.set_parent(tile, self.border_threshold + direction + 2)
             if verbose:
                 print(
                     f"Parent of {pos} is now {self.border_threshold + direction + 2} (threshold at {self.border_threshold}) "
@@ -72,7 +112,7 @@ class UFindCC:
                         )
                     return
 
-        self.parents[tile] = tile
+        self.set_parent(tile, tile)
         if verbose:
             print("No parent addind tile!")
 
@@ -83,10 +123,15 @@ class UFindCC:
         return self.find(tile)
 
     def find(self, i) -> int:
-        # Perform flattening if necessary
-        if self.parents[i] != i:
-            self.parents[i] = self.find(self.parents[i])
-        return self.parents[i]
+        # NOTE: empty slots (-1) resolve to the last border element through negative indexing (as the former recursive version)
+        parents = self.parents
+        while parents[i] != i:
+            grandparent = parents[parents[i]]
+            # Path halving: make i point to its grandparent
+            if grandparent != parents[i]:
+                self.set_parent(i, grandparent)
+            i = grandparent
+        return i
 
     def union(self, i, j) -> None:
         root_i = self.find(i)
@@ -94,6 +139,15 @@ class UFindCC:
         # If they are not already in the same CC, connect them
         if root_i != root_j:
             if root_i >= self.border_threshold:
-                self.parents[root_j] = root_i
+                self.set_parent(root_j, root_i)
+            elif root_j >= self.border_threshold:
+                self.set_parent(root_i, root_j)
+            elif self.ranks[root_i] < self.ranks[root_j]:
+                self.set_parent(root_i, root_j)
+            elif self.ranks[root_i] > self.ranks[root_j]:
+                self.set_parent(root_j, root_i)
             else:
-                self.parents[root_i] = root_j
+                self.set_parent(root_i, root_j)
+                self.undo_log.append(self.nb_elements + root_j)
+                self.undo_log.append(self.ranks[root_j])
+                self.ranks[root_j] += 1
@@ -0,0 +1,83 @@
+import numpy as np
+
+# Fixed seed so that keys are reproducible across processes and runs
+ZOBRIST_SEED = 581
+
+
+class ZobristTable:
+    """Random 64-bit keys used to hash Quoridor states incrementally
+
+    The key of a state is the XOR of the keys of its pawn positions, its walls,
+    the number of walls used by each player, its time step and its current player.
+    Every action thus updates the key with a few XORs (see QuoridorEnv.move_pawn and QuoridorEnv.add_wall).
+    """
+
+    def __init__(self, grid_size: int, max_walls: int, max_t: int) -> None:
+        self.grid_size = grid_size
+        rng = np.random.default_rng(ZOBRIST_SEED)
+
+        def draw(nb_keys: int):
+            # Convert to Python ints to avoid NumPy scalars in XORs
+            return rng.integers(0, 2**64, size=nb_keys,
+                                dtype=np.uint64).tolist()
+
+        # pawns[player_idx][x * grid_size + y]
+        self.pawns = [draw(grid_size * grid_size) for _ in range(2)]
+        # walls[direction][x * (grid_size - 1) + y]
+        self.walls = [
+            draw((grid_size - 1) * (grid_size - 1)) for _ in range(2)
+        ]
+        # nb_walls[player_idx][number of walls already placed]
+        self.nb_walls = [draw(max_walls + 1) for _ in range(2)]
+        self.times = draw(max_t + 1)
+        self.player = draw(1)[0]
+
+    def pawn_key(self, player_idx: int, position) -> int:
+        return self.pawns[player_idx][position[0] * self.grid_size +
+                                      position[1]]
+
+    def wall_key(self, position, direction: int) -> int:
+        return self.walls[direction][position[0] * (self.grid_size - 1) +
+                                     position[1]]
+
+    def turn_key(self, t: int) -> int:
+        # Part of the key updated by every action (time step and current player)
+        return self.time_key(t) ^ self.time_key(t + 1) ^ self.player
+
+    def time_key(self, t: int) -> int:
+        # NOTE: wrap around in case a game is played beyond max_t
+        return self.times[t % len(self.times)]
+
+    def hash_state(self, state) -> int:
+        """Computes the key of a state from scratch
+
+        Args:
+            state (QuoridorState): the state to hash
+
+        Returns:
+            int: the 64-bit key of the state
+        """
+        key = self.time_key(state.t)
+        for player_idx in range(2):
+            key ^= self.pawn_key(player_idx,
+                                 state.player_positions[player_idx])
+            key ^= self.nb_walls[player_idx][state.nb_walls[player_idx]]
+        for i in range(self.grid_size - 1):
+            for j in range(self.grid_size - 1):
+                if state.walls[i, j] >= 0:
+                    key ^= self.wall_key((i, j), state.walls[i, j])
+        if state.current_player == 1:
+            key ^= self.player
+        return key
+
+
+ZOBRIST_TABLES = {}
+
+
+def get_zobrist_table(grid_size: int, max_walls: int,
+                      max_t: int) -> ZobristTable:
+    # Tables are shared by every state and environment with the same game config
+    config_key = (grid_size, max_walls, max_t)
+    if config_key not in ZOBRIST_TABLES:
+        ZOBRIST_TABLES[config_key] = ZobristTable(grid_size, max_walls, max_t)
+    return ZOBRIST_TABLES[config_key]